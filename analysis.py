@@ -0,0 +1,265 @@
+"""Textract calls shared by every route that needs a document analysed."""
+import logging
+import os
+import time
+import uuid
+
+from botocore import xform_name
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client, get_textract_client
+from concurrency import AdaptiveCaller
+from features import plan_feature_types
+from metrics import observe_textract, record_cache, record_coalesced, record_retry
+from ratelimit import RateLimiter, current_account
+from replay import ResponseRecorder
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from timing import stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_S3_BUCKET = os.environ.get("DEFAULT_S3_BUCKET", "delamyth1")
+DEFAULT_S3_KEY = os.environ.get("DEFAULT_S3_KEY", "delamythrealdeal.jpg")
+
+# analyze_document only takes single-page images up to 5 MB; anything else goes
+# through the asynchronous StartDocumentAnalysis API.
+SYNC_MAX_BYTES = int(os.environ.get("TEXTRACT_SYNC_MAX_BYTES", 5 * 1024 * 1024))
+MULTIPAGE_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+
+STAGING_BUCKET = os.environ.get("TEXTRACT_STAGING_BUCKET", DEFAULT_S3_BUCKET)
+STAGING_PREFIX = os.environ.get("TEXTRACT_STAGING_PREFIX", "textract-staging/")
+ASYNC_TIMEOUT = float(os.environ.get("TEXTRACT_ASYNC_TIMEOUT", 600))
+
+# Synchronous calls on uploads above this size pass an S3Object instead of
+# Bytes, so the worker never holds base64 copies of a multi-MB image.
+S3_THRESHOLD = int(os.environ.get("TEXTRACT_S3_THRESHOLD", 1024 * 1024))
+
+response_cache = ResponseCache.from_env()
+rate_limiter = RateLimiter.from_env()
+# Workers sharing the disk cache also share its in-flight locks.
+in_flight = SingleFlight(os.path.join(response_cache.disk.directory, "locks") if response_cache.disk else None)
+adaptive_caller = AdaptiveCaller.from_env(on_retry=record_retry)
+recorder = ResponseRecorder.from_env()
+
+
+def feature_key(feature_types):
+    return ",".join(feature_types) or "TEXT"
+
+
+def textract_call(textract, operation, **params):
+    """Call a Textract operation under the shared rate limit and adaptive concurrency, with retries.
+
+    Every Textract request goes through here, so each attempt is rate limited,
+    counted and timed, and transient failures are retried until the request's
+    deadline.
+    """
+    method = getattr(textract, xform_name(operation))
+
+    def wait_for_token():
+        with stage("rate_limit"):
+            rate_limiter.acquire(current_account(), textract.meta.region_name, operation)
+
+    def attempt():
+        with observe_textract(operation):
+            return method(**params)
+
+    return adaptive_caller.call(attempt, operation, before=wait_for_token)
+
+
+def call_textract(document, feature_types):
+    """analyze_document for the planned features, or detect_document_text when none are needed."""
+    textract = get_textract_client()
+    with stage("textract"):
+        if not feature_types:
+            return textract_call(textract, "DetectDocumentText", Document=document)
+        return textract_call(
+            textract, "AnalyzeDocument",
+            Document=document,
+            FeatureTypes=feature_types
+        )
+
+
+def cached_analysis(key, cache, label, run):
+    """Answer from the response cache, else ``run()`` Textract once for all concurrent callers with ``key``."""
+    with stage("cache"):
+        cached = response_cache.get(key)
+    record_cache(cache, cached is not None)
+    if cached is not None:
+        logger.info(f"Textract cache hit for {label}")
+        return cached
+
+    def fetch():
+        # Another request (or worker) may have finished it while we waited our turn.
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        response = run()
+        response_cache.put(key, response)
+        return response
+
+    response, shared = in_flight.do(key, fetch)
+    if shared:
+        record_coalesced()
+        logger.info(f"Shared in-flight Textract analysis for {label}")
+    return response
+
+
+def call_textract_on_upload(upload, feature_types):
+    """call_textract for an upload, recording or replaying the response when configured (see replay.py)."""
+    features = feature_key(feature_types)
+    if recorder.replaying:
+        with stage("textract"):
+            return recorder.replay(upload.sha256, features)
+    start = time.monotonic()
+    response = _call_textract_on_upload(upload, feature_types)
+    if recorder.recording:
+        recorder.save(upload.sha256, features, response, time.monotonic() - start)
+    return response
+
+
+def _call_textract_on_upload(upload, feature_types):
+    """call_textract with the upload's bytes, or via a per-call staged object when it is large."""
+    if upload.size <= S3_THRESHOLD:
+        return call_textract({"Bytes": upload.read()}, feature_types)
+    key = stage_upload(upload)
+    try:
+        return call_textract({"S3Object": {"Bucket": STAGING_BUCKET, "Name": key}}, feature_types)
+    finally:
+        remove_staged(key)
+
+
+def analyze(upload, feature_types=None):
+    """Run Textract on an upload, answering from the response cache when its bytes were seen before."""
+    if feature_types is None:
+        feature_types = plan_feature_types()
+    key = upload.content_key(feature_key(feature_types))
+    return cached_analysis(key, "content", key[:12], lambda: call_textract_on_upload(upload, feature_types))
+
+
+def s3_object_key(bucket, name, feature_types, head=None):
+    """(cache key, VersionId) for an S3 object; the key is None when it cannot be HEADed.
+
+    The ETag changes whenever the object's content does, and VersionId pins
+    the exact revision on versioned buckets, so a HEAD is enough to tell
+    whether a cached analysis still describes the object. Pass ``head`` when
+    the caller has already HEADed the object.
+    """
+    if head is None:
+        try:
+            with stage("s3_head"):
+                head = get_client("s3").head_object(Bucket=bucket, Key=name)
+        except ClientError as e:
+            logger.warning(f"HEAD s3://{bucket}/{name} failed, analysing uncached: {e}")
+            return None, None
+    etag = head.get("ETag", "").strip('"')
+    version = head.get("VersionId")
+    if not etag:
+        return None, version
+    return ":".join([f"s3://{bucket}/{name}", etag, version or "", feature_key(feature_types)]), version
+
+
+def analyze_s3_object(bucket, name, feature_types=None, object_key=None):
+    """Run Textract on an S3 object, reusing the analysis while its ETag is unchanged.
+
+    ``object_key`` is an ``s3_object_key`` result the caller already has; the
+    analysis is then of exactly that revision.
+    """
+    if feature_types is None:
+        feature_types = plan_feature_types()
+    if object_key is None:
+        object_key = s3_object_key(bucket, name, feature_types)
+    key, version = object_key
+    s3_object = {"Bucket": bucket, "Name": name}
+    if version:
+        s3_object["Version"] = version
+    document = {"S3Object": s3_object}
+    if key is None:
+        return call_textract(document, feature_types)
+    return cached_analysis(key, "s3", f"s3://{bucket}/{name}", lambda: call_textract(document, feature_types))
+
+
+def needs_async_analysis(size, filename):
+    return (size > SYNC_MAX_BYTES
+            or (filename or '').lower().endswith(MULTIPAGE_EXTENSIONS))
+
+
+def stage_upload(upload):
+    """Stream the upload into the staging bucket and return its S3 key.
+
+    Every call gets its own key: the same file submitted twice at once must
+    not share an object that whichever call finishes first deletes.
+    """
+    ext = os.path.splitext(upload.filename or '')[1].lower()
+    key = f"{STAGING_PREFIX}{upload.sha256}-{uuid.uuid4().hex}{ext}"
+    with stage("s3_upload"):
+        get_client("s3").put_object(Bucket=STAGING_BUCKET, Key=key, Body=upload.stream(),
+                                    ContentLength=upload.size)
+    return key
+
+
+def remove_staged(key):
+    try:
+        get_client("s3").delete_object(Bucket=STAGING_BUCKET, Key=key)
+    except ClientError as e:
+        logger.warning(f"Could not remove staged upload s3://{STAGING_BUCKET}/{key}: {e}")
+
+
+def _wait_for_analysis(textract, operation, job_id):
+    """Poll a Get* job API with capped exponential backoff; return the first result page."""
+    delay = 1.0
+    deadline = time.monotonic() + ASYNC_TIMEOUT
+    while True:
+        page = textract_call(textract, operation, JobId=job_id, MaxResults=1000)
+        status = page.get("JobStatus")
+        if status == "SUCCEEDED":
+            return page
+        if status == "PARTIAL_SUCCESS":
+            logger.warning(f"Textract job {job_id} partially succeeded: {page.get('StatusMessage')}")
+            return page
+        if status == "FAILED":
+            raise RuntimeError(f"Textract job {job_id} failed: {page.get('StatusMessage', 'unknown error')}")
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Textract job {job_id} did not finish within {ASYNC_TIMEOUT:.0f}s")
+        time.sleep(delay)
+        delay = min(delay * 1.5, 10.0)
+
+
+def stream_document_analysis(bucket, name, feature_types=None, version=None):
+    """Run StartDocumentAnalysis on an S3 object and yield Blocks one result page at a time."""
+    if feature_types is None:
+        feature_types = plan_feature_types()
+    textract = get_textract_client()
+    location = {"S3Object": {"Bucket": bucket, "Name": name}}
+    if version:
+        location["S3Object"]["Version"] = version
+    if feature_types:
+        job_id = textract_call(
+            textract, "StartDocumentAnalysis",
+            DocumentLocation=location,
+            FeatureTypes=feature_types
+        )["JobId"]
+        operation = "GetDocumentAnalysis"
+    else:
+        job_id = textract_call(textract, "StartDocumentTextDetection", DocumentLocation=location)["JobId"]
+        operation = "GetDocumentTextDetection"
+    logger.info(f"Started Textract job {job_id} for s3://{bucket}/{name}")
+
+    with stage("textract"):
+        page = _wait_for_analysis(textract, operation, job_id)
+    while True:
+        yield page.get("Blocks", [])
+        token = page.get("NextToken")
+        if not token:
+            break
+        with stage("textract"):
+            page = textract_call(textract, operation, JobId=job_id, MaxResults=1000, NextToken=token)
+
+
+def stream_large_upload(upload, profile=None):
+    """Stage an upload in S3 and stream its asynchronous analysis, removing it afterwards."""
+    key = stage_upload(upload)
+    try:
+        yield from stream_document_analysis(STAGING_BUCKET, key, plan_feature_types(profile))
+    finally:
+        remove_staged(key)
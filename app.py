@@ -1,10 +1,28 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, g
 from flask_cors import CORS
-import boto3
-from datetime import datetime, timedelta
-import re
+import contextvars
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from analysis import (DEFAULT_S3_BUCKET, DEFAULT_S3_KEY, adaptive_caller, analyze_s3_object, feature_key,
+                      needs_async_analysis, s3_object_key, stream_document_analysis, stream_large_upload)
+from archive import ResponseArchive, document_id
+from concurrency import DeadlineExceeded, clear_deadline, error_code, is_throttle, set_deadline
+from direct_uploads import UPLOAD_BUCKET, UploadNotFound, head_upload, presign_upload, upload_key
+from features import UnknownProfile, plan_feature_types
+from idempotency import Idempotency, InvalidKey, KeyReused, StillProcessing
+from jobs import JobQueue, QueueFull, QUEUED
+from ocr_backends import OCRRouter
+from ratelimit import RateLimited
+from replay import NotRecorded
+from response_cache import content_key
+from templates import TemplateRegistry, summarize_with_templates
+from timesheet import PagedSummary, build_summary, summarize
+import metrics
+import timing
+from timing import stage
+from uploads import InvalidUpload, Upload, UploadTooLarge, check_filename
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +31,88 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+job_queue = JobQueue.from_env()
+idempotency = Idempotency.from_env()
+ocr_router = OCRRouter.from_env()
+
+# Raw responses kept for re-parsing when the parser changes (see archive.py).
+response_archive = ResponseArchive.from_env()
+
+# Learned layouts let recurring forms skip TABLES analysis (see templates.py).
+layout_templates = TemplateRegistry.from_env() if os.environ.get("LAYOUT_TEMPLATES") == "1" else None
+
+BATCH_MAX_IMAGES = int(os.environ.get("BATCH_MAX_IMAGES", 50))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 8))
+
+# Total time a request may spend waiting on and retrying Textract; unset means
+# each call gets TEXTRACT_DEADLINE on its own.
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", 0))
+
+
+def route_label():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@app.before_request
+def start_timings():
+    g.timing_token = timing.begin()
+    g.route = route_label()
+    metrics.http_in_flight.labels(g.route).inc()
+    if REQUEST_DEADLINE:
+        g.deadline_token = set_deadline(REQUEST_DEADLINE)
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = timing.current()
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.header()
+        route = g.get("route", "unmatched")
+        metrics.http_requests.labels(route, request.method, response.status_code).inc()
+        metrics.http_latency.labels(route).observe(timings.total())
+        for name, seconds in timings.durations.items():
+            metrics.stage_latency.labels(route, name).observe(seconds)
+    return response
+
+
+@app.teardown_request
+def stop_timings(exc):
+    token = g.pop("timing_token", None)
+    if token is not None:
+        timing.end(token)
+    deadline_token = g.pop("deadline_token", None)
+    if deadline_token is not None:
+        clear_deadline(deadline_token)
+    route = g.pop("route", None)
+    if route is not None:
+        metrics.http_in_flight.labels(route).dec()
+
+
+def retry_later(e, code):
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = str(max(1, round(e.retry_after)))
+    return response, code
+
+
+def rate_limited(e):
+    return retry_later(e, 429)
+
+
+def textract_throttled(e):
+    """429 for Textract throttling that outlasted every retry, like our own rate limit."""
+    return rate_limited(RateLimited(f"Textract is throttling requests ({error_code(e)}), try again later.",
+                                    adaptive_caller.policy.cap))
+
+
+def timed_json(payload):
+    """jsonify ``payload``, adding the stage breakdown to it for ?debug=timings."""
+    timings = timing.current()
+    if timings is not None and request.args.get("debug") == "timings":
+        payload = dict(payload, timings=timings.as_dict())
+    with stage("serialize"):
+        return jsonify(payload)
+
+
 @app.route("/", methods=["GET"])
 def index():
     return """
@@ -34,7 +134,7 @@ def index():
                 <form id="upload-form" enctype="multipart/form-data" action="/process" method="POST">
                     <div class="form-group">
                         <label for="image">Upload timesheet image:</label>
-                        <input type="file" id="image" name="image" accept="image/*">
+                        <input type="file" id="image" name="image" accept="image/*,application/pdf">
                     </div>
                     <button type="submit" class="btn">Process Image</button>
                 </form>
@@ -88,144 +188,352 @@ def index():
     </html>
     """
 
+def credentials_error():
+    aws_access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+    aws_secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+
+    if not aws_access_key or not aws_secret_key:
+        logger.error("AWS credentials not configured")
+        return jsonify({"error": "AWS credentials not configured. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables."}), 500
+    return None
+
+
+def read_image(image_file):
+    logger.info(f"Processing uploaded file: {image_file.filename}")
+
+    check_filename(image_file.filename)
+    upload = Upload.spool(image_file.filename, image_file.stream)
+    metrics.upload_bytes.inc(upload.size)
+    return upload
+
+
+def read_upload():
+    """The uploaded image as an uploads.Upload, or None to use the default S3 image."""
+    if 'image' in request.files and request.files['image'].filename:
+        return read_image(request.files['image'])
+
+    logger.info("No image uploaded, using default S3 image")
+    return None
+
+
+def read_profile():
+    """Extraction profile requested with ?profile=, validated up front."""
+    profile = request.values.get("profile") or None
+    plan_feature_types(profile)
+    return profile
+
+
+def summarize_pages(pages):
+    summary = PagedSummary()
+    for blocks in pages:
+        summary.feed(blocks)
+    return summary.summary()
+
+
+def archived(doc_id, summary):
+    """Record the summary under its parser version and tell the client the document id."""
+    if doc_id is None:
+        return summary
+    response_archive.save_summary(doc_id, summary)
+    return dict(summary, document_id=doc_id)
+
+
+def s3_document_id(object_key):
+    """Archive id for an ``s3_object_key`` result, or None when not archiving or the object is unknown."""
+    key, _ = object_key
+    if response_archive is None or key is None:
+        return None
+    return document_id(key)
+
+
+def process_document(upload=None, profile=None):
+    feature_types = plan_feature_types(profile)
+    features = feature_key(feature_types)
+    doc_id = None
+    if upload is not None and response_archive is not None:
+        doc_id = document_id(upload.content_key(features))
+
+    if upload is not None and needs_async_analysis(upload.size, upload.filename):
+        logger.info(f"Using asynchronous analysis for {upload.filename}")
+        pages = stream_large_upload(upload, profile)
+        if doc_id is not None:
+            pages = response_archive.tee_pages(doc_id, upload.filename, features, pages)
+        return archived(doc_id, summarize_pages(pages))
+
+    if upload is not None and layout_templates is not None and feature_types:
+        summary, template, response = summarize_with_templates(upload, layout_templates, feature_types,
+                                                               ocr_router.analyze)
+        if template is None:
+            if doc_id is not None:
+                response_archive.store_response(doc_id, upload.filename, features, response)
+            return archived(doc_id, summary)
+        summary = dict(summary, layout_template=template.fingerprint)
+        if doc_id is not None:
+            # Parsed with the template's column edges, which a re-parse of the
+            # stored blocks could not reproduce, so this one is not archived.
+            summary["document_id"] = None
+        return summary
+
+    if upload is None:
+        # One HEAD names both the archived document and the revision analysed.
+        object_key = s3_object_key(DEFAULT_S3_BUCKET, DEFAULT_S3_KEY, feature_types)
+        doc_id = s3_document_id(object_key)
+        response = analyze_s3_object(DEFAULT_S3_BUCKET, DEFAULT_S3_KEY, feature_types, object_key)
+        if doc_id is not None:
+            response_archive.store_response(doc_id, f"s3://{DEFAULT_S3_BUCKET}/{DEFAULT_S3_KEY}", features,
+                                            response)
+        return archived(doc_id, summarize(response))
+    response = ocr_router.analyze(upload, feature_types)
+    if doc_id is not None:
+        response_archive.store_response(doc_id, upload.filename, features, response)
+    return archived(doc_id, summarize(response))
+
+
+def process_uploaded_object(key, profile=None):
+    """Summary of an image the client uploaded straight to S3."""
+    feature_types = plan_feature_types(profile)
+    features = feature_key(feature_types)
+    source = f"s3://{UPLOAD_BUCKET}/{key}"
+    head = head_upload(key)
+    object_key = s3_object_key(UPLOAD_BUCKET, key, feature_types, head)
+    doc_id = s3_document_id(object_key)
+
+    if needs_async_analysis(head["ContentLength"], key):
+        logger.info(f"Using asynchronous analysis for {source}")
+        pages = stream_document_analysis(UPLOAD_BUCKET, key, feature_types, version=object_key[1])
+        if doc_id is not None:
+            pages = response_archive.tee_pages(doc_id, source, features, pages)
+        return archived(doc_id, summarize_pages(pages))
+
+    response = analyze_s3_object(UPLOAD_BUCKET, key, feature_types, object_key)
+    if doc_id is not None:
+        response_archive.store_response(doc_id, source, features, response)
+    return archived(doc_id, summarize(response))
+
+
+def run_job(upload, profile):
+    try:
+        return process_document(upload, profile)
+    finally:
+        if upload is not None:
+            upload.close()
+
+
 @app.route("/process", methods=["POST"])
 def process_image():
+    upload = None
     try:
-        aws_access_key = os.environ.get("AWS_ACCESS_KEY_ID")
-        aws_secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        error = credentials_error()
+        if error:
+            return error
 
-        if not aws_access_key or not aws_secret_key:
-            logger.error("AWS credentials not configured")
-            return jsonify({"error": "AWS credentials not configured. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables."}), 500
+        profile = read_profile()
+        with stage("upload"):
+            upload = read_upload()
 
-        if 'image' in request.files and request.files['image'].filename:
-            image_file = request.files['image']
-            logger.info(f"Processing uploaded file: {image_file.filename}")
-            
-            if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
-                return jsonify({"error": "Invalid file format. Please upload an image file."}), 400
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key is None:
+            return timed_json(process_document(upload, profile))
 
-            image_bytes = image_file.read()
-            document = {"Bytes": image_bytes}
+        # The same key with a different image or profile is a client bug, not a retry.
+        if upload is not None:
+            fingerprint = upload.content_key(upload.filename, profile)
         else:
-            logger.info("No image uploaded, using default S3 image")
-            document = {"S3Object": {"Bucket": "delamyth1", "Name": "delamythrealdeal.jpg"}}
-
-        textract = boto3.client(
-            "textract",
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name="eu-west-1"
-        )
-
-        response = textract.analyze_document(
-            Document=document,
-            FeatureTypes=["TABLES", "FORMS"]
-        )
-
-        month_year = None
-        for block in response.get("Blocks", []):
-            text = block.get("Text", "")
-            if not text:
-                continue
-            match = re.search(r"(\d{1,2})\s*/\s*(\d{1,2})\s*/\s*(\d{2})", text)
-            if match:
-                day, month_num, year_suffix = match.groups()
-                months = ["January", "February", "March", "April", "May", "June",
-                          "July", "August", "September", "October", "November", "December"]
-                mi = int(month_num)
-                if 1 <= mi <= 12:
-                    month_year = f"{months[mi-1]} 20{year_suffix}"
-                    break
-
-        def correct_time_format(text):
-            subs = {
-                '!': '1', 'I': '1', 'l': '1', '|': '1',
-                'O': '0', 'o': '0',
-                '%': ':', ';': ':', ',': ':', '.': ':'
-            }
-            for wrong, right in subs.items():
-                text = text.replace(wrong, right)
-            digits = re.sub(r"\D", "", text)
-            if len(digits) >= 4:
-                return f"{digits[:2]}:{digits[2:4]}"
-            if len(digits) == 3:
-                return f"0{digits[0]}:{digits[1:3]}"
-            return text
-
-        cells = {}
-        for block in response.get("Blocks", []):
-            if block.get("BlockType") == "CELL":
-                r, c = block["RowIndex"], block["ColumnIndex"]
-                txt = ''
-                if "Relationships" in block:
-                    for rel in block["Relationships"]:
-                        if rel["Type"] == "CHILD":
-                            for cid in rel["Ids"]:
-                                child = next((b for b in response["Blocks"] if b["Id"] == cid), {})
-                                if child.get("BlockType") == "WORD":
-                                    txt += child.get("Text", '') + ' '
-                cells.setdefault(r, {})[c] = txt.strip()
+            fingerprint = content_key(b"", profile)
+        summary, replayed = idempotency.run(
+            idempotency_key, fingerprint,
+            lambda: process_document(upload, profile))
+        response = timed_json(summary)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
 
-        weekly_totals = {}
-        daily_hours = {}
+    except (InvalidUpload, UnknownProfile, InvalidKey) as e:
+        return jsonify({"error": str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except KeyReused as e:
+        return jsonify({"error": str(e)}), 422
+    except NotRecorded as e:
+        # Replay mode: the image was never recorded, so there is nothing to serve.
+        return jsonify({"error": str(e)}), 404
+    except StillProcessing as e:
+        return retry_later(e, 409)
+    except RateLimited as e:
+        return rate_limited(e)
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        if is_throttle(e):
+            return textract_throttled(e)
+        logger.error(f"Error processing image: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if upload is not None:
+            upload.close()
 
-        for row_idx, cols in cells.items():
-            name_raw = cols.get(1, '').strip()
-            name = re.sub(r'\bIN\b', '', name_raw).strip()
-            if not name or name.upper() in ("DATE", "DAY", "IN", "OUT"):
+
+@app.route("/process/batch", methods=["POST"])
+def process_batch():
+    uploads = []
+    try:
+        error = credentials_error()
+        if error:
+            return error
+
+        with stage("upload"):
+            image_files = [f for f in request.files.getlist('image') if f.filename]
+        if not image_files:
+            return jsonify({"error": "No images uploaded."}), 400
+        if len(image_files) > BATCH_MAX_IMAGES:
+            return jsonify({"error": f"Too many images, at most {BATCH_MAX_IMAGES} per batch."}), 400
+
+        profile = read_profile()
+        with stage("upload"):
+            for f in image_files:
+                uploads.append(read_image(f))
+
+        # Textract latency is I/O bound, so the calls overlap well on threads.
+        workers = min(BATCH_CONCURRENCY, len(uploads))
+        with stage("analysis"), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            # Pool threads start with an empty context; give each call a copy of
+            # the request's so its deadline and stage timings apply.
+            futures = [pool.submit(contextvars.copy_context().run, process_document, upload, profile)
+                       for upload in uploads]
+
+        results = []
+        weekly_totals = {}
+        for upload, future in zip(uploads, futures):
+            filename = upload.filename
+            try:
+                summary = future.result()
+            except Exception as e:
+                logger.error(f"Error processing {filename}: {str(e)}")
+                results.append({"filename": filename, "error": str(e)})
                 continue
+            results.append({"filename": filename, "summary": summary})
+            for name, hours in summary["weekly_totals"].items():
+                weekly_totals[name] = weekly_totals.get(name, 0) + hours
 
-            total_seconds = 0
-            daily_seconds = {}
-
-            for c in sorted(cols.keys()):
-                if c == 1:
-                    continue
-                entry = cols[c]
-                entry = re.sub(r'IN(?=\d)', 'IN ', entry)
-                entry = re.sub(r'(?<=\d)OUT', ' OUT', entry)
-                parts = re.split(r'\s+', entry)
-                times = []
-                for part in parts:
-                    part = correct_time_format(part)
-                    if re.match(r"^\d{1,2}:\d{2}$", part):
-                        times.append(part)
-
-                day_seconds = 0
-                for i in range(0, len(times)-1, 2):
-                    try:
-                        start = datetime.strptime(times[i], "%H:%M")
-                        end = datetime.strptime(times[i+1], "%H:%M")
-                        if end <= start:
-                            end += timedelta(hours=12)
-                        diff = (end - start).total_seconds()
-                        day_seconds += diff
-                    except ValueError:
-                        continue
-
-                daily_seconds[c] = day_seconds
-                total_seconds += day_seconds
-
-            weekly_totals[name] = round((total_seconds / 3600) * 4) / 4
-            daily_hours[name] = {day: round((sec / 3600) * 4) / 4 for day, sec in daily_seconds.items()}
-
-        max_hours = max(weekly_totals.values()) if weekly_totals else 0
-        top_performers = [n for n, h in weekly_totals.items() if h == max_hours and h > 0]
-
-        summary = {
-            "month": month_year or "Unknown",
-            "top_performers": top_performers,
+        merged = build_summary(None, weekly_totals, {})
+        return timed_json({
+            "results": results,
+            "top_performers": merged["top_performers"],
             "weekly_totals": weekly_totals,
-            "daily_hours": daily_hours,
-        }
+        })
 
-        return jsonify(summary)
+    except (InvalidUpload, UnknownProfile) as e:
+        return jsonify({"error": str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        if is_throttle(e):
+            return textract_throttled(e)
+        logger.error(f"Error processing batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        for upload in uploads:
+            upload.close()
 
+
+@app.route("/uploads", methods=["POST"])
+def create_upload():
+    try:
+        error = credentials_error()
+        if error:
+            return error
+
+        body = request.get_json(silent=True) or {}
+        filename = body.get("filename") or request.values.get("filename")
+        content_type = body.get("content_type") or request.values.get("content_type")
+        return jsonify(presign_upload(filename, content_type)), 201
+
+    except InvalidUpload as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error processing image: {str(e)}")
+        logger.error(f"Error presigning upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/uploads/<upload_id>/complete", methods=["POST"])
+def complete_upload(upload_id):
+    try:
+        error = credentials_error()
+        if error:
+            return error
+
+        profile = read_profile()
+        summary = process_uploaded_object(upload_key(upload_id), profile)
+        return timed_json(summary)
+
+    except UploadNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except UnknownProfile as e:
+        return jsonify({"error": str(e)}), 400
+    except RateLimited as e:
+        return rate_limited(e)
+    except DeadlineExceeded as e:
+        return jsonify({"error": str(e)}), 504
+    except Exception as e:
+        if is_throttle(e):
+            return textract_throttled(e)
+        logger.error(f"Error processing upload {upload_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    try:
+        error = credentials_error()
+        if error:
+            return error
+
+        profile = read_profile()
+        with stage("upload"):
+            upload = read_upload()
+        try:
+            job_id = job_queue.submit(run_job, upload, profile)
+        except Exception:
+            if upload is not None:
+                upload.close()
+            raise
+
+        response = jsonify({"job_id": job_id, "status": QUEUED})
+        response.headers["Location"] = f"/jobs/{job_id}"
+        return response, 202
+
+    except (InvalidUpload, UnknownProfile) as e:
+        return jsonify({"error": str(e)}), 400
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error creating job: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/documents/<document_id>", methods=["GET"])
+def get_document(document_id):
+    if response_archive is None:
+        return jsonify({"error": "Document archive is not enabled"}), 404
+    document = response_archive.get(document_id, request.args.get("parser_version"))
+    if document is None:
+        return jsonify({"error": "Document not found"}), 404
+    return jsonify(document)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
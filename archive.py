@@ -0,0 +1,222 @@
+"""Archive of raw OCR responses and the summaries parsed from them.
+
+With ARCHIVE_DIR set, the blocks of every analysed upload or S3 object
+(presigned uploads and the default timesheet, identified by ETag and
+VersionId) are kept as gzipped JSON lines (one line per result page) under a
+document id, and each summary is recorded against the parser version that
+produced it (timesheet.PARSER_VERSION). When the parser changes, stored
+documents are re-parsed without going back to Textract:
+
+    python archive.py reparse --workers 8
+
+which recomputes every document lacking a summary for the current version on a
+process pool. GET /documents/<id> returns the newest summary and lists the
+versions available. Document metadata and summaries live in SQLite next to
+the blocks, shared by every gunicorn worker.
+
+Sheets parsed with a learned layout template (templates.py) are the one
+exception: their cells come from the template's column edges, which a re-parse
+of the stored blocks could not reproduce, so they are answered with a null
+document_id and the template's fingerprint instead. A sheet whose layout is
+not matched is archived from its TABLES analysis as usual.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from stores import SQLiteStore
+from timesheet import PARSER_VERSION, PagedSummary, summarize
+
+logger = logging.getLogger(__name__)
+
+# How a document was parsed originally, so a re-parse takes the same route.
+RESPONSE = "response"  # one complete response, parsed with summarize()
+PAGES = "pages"        # streamed result pages, parsed with PagedSummary
+
+
+def document_id(content_key):
+    return hashlib.sha256(content_key.encode()).hexdigest()[:32]
+
+
+def read_pages(path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+def parse_stored(path, mode):
+    """Summary of stored blocks, taking the same route as the original request."""
+    if mode == RESPONSE:
+        blocks = [block for page in read_pages(path) for block in page]
+        return summarize({"Blocks": blocks})
+    summary = PagedSummary()
+    for blocks in read_pages(path):
+        summary.feed(blocks)
+    return summary.summary()
+
+
+def _reparse(item):
+    doc_id, path, mode = item
+    try:
+        return doc_id, parse_stored(path, mode), None
+    except Exception as e:
+        return doc_id, None, str(e)
+
+
+class ResponseArchive(SQLiteStore):
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(os.path.join(directory, "archive.sqlite3"), [
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " document_id TEXT PRIMARY KEY,"
+            " filename TEXT,"
+            " features TEXT NOT NULL,"
+            " mode TEXT NOT NULL,"
+            " stored_at REAL NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " document_id TEXT NOT NULL,"
+            " parser_version TEXT NOT NULL,"
+            " summary TEXT NOT NULL,"
+            " computed_at REAL NOT NULL,"
+            " PRIMARY KEY (document_id, parser_version))",
+        ])
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("ARCHIVE_DIR")
+        return cls(directory) if directory else None
+
+    def path(self, doc_id):
+        return os.path.join(self.directory, doc_id[:2], f"{doc_id}.jsonl.gz")
+
+    def _write(self, doc_id, filename, features, mode, pages):
+        """Write ``pages`` (yielding each on) and register the document once all are stored."""
+        path = self.path(doc_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+                for blocks in pages:
+                    fh.write(json.dumps(blocks, default=str) + "\n")
+                    yield blocks
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, filename, features, mode, stored_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (doc_id, filename, features, mode, time.time()),
+            )
+
+    def has(self, doc_id):
+        return self._connect().execute(
+            "SELECT 1 FROM documents WHERE document_id = ?", (doc_id,)
+        ).fetchone() is not None
+
+    def store_response(self, doc_id, filename, features, response):
+        # Document ids are content addressed, so a stored document never changes.
+        if self.has(doc_id):
+            return
+        for _ in self._write(doc_id, filename, features, RESPONSE, [response.get("Blocks", [])]):
+            pass
+
+    def tee_pages(self, doc_id, filename, features, pages):
+        """Pass result pages through while storing them, unless the document is already stored."""
+        if self.has(doc_id):
+            return pages
+        return self._write(doc_id, filename, features, PAGES, pages)
+
+    def save_summary(self, doc_id, summary, parser_version=PARSER_VERSION):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (document_id, parser_version, summary, computed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (doc_id, parser_version, json.dumps(summary), time.time()),
+            )
+
+    def get(self, doc_id, parser_version=None):
+        """The document with its summary from ``parser_version`` (default the newest), or None."""
+        conn = self._connect()
+        doc = conn.execute(
+            "SELECT filename, features, stored_at FROM documents WHERE document_id = ?", (doc_id,)
+        ).fetchone()
+        if doc is None:
+            return None
+        rows = conn.execute(
+            "SELECT parser_version, summary FROM summaries WHERE document_id = ? ORDER BY computed_at",
+            (doc_id,),
+        ).fetchall()
+        versions = [row[0] for row in rows]
+        summaries = {row[0]: row[1] for row in rows}
+        version = parser_version or (versions[-1] if versions else None)
+        return {
+            "document_id": doc_id,
+            "filename": doc[0],
+            "features": doc[1],
+            "stored_at": doc[2],
+            "parser_versions": versions,
+            "parser_version": version if version in summaries else None,
+            "summary": json.loads(summaries[version]) if version in summaries else None,
+        }
+
+    def stale(self, parser_version=PARSER_VERSION):
+        """(document id, path, mode) of documents without a summary from ``parser_version``."""
+        rows = self._connect().execute(
+            "SELECT document_id, mode FROM documents WHERE document_id NOT IN"
+            " (SELECT document_id FROM summaries WHERE parser_version = ?)",
+            (parser_version,),
+        ).fetchall()
+        return [(doc_id, self.path(doc_id), mode) for doc_id, mode in rows]
+
+    def reparse(self, workers=None, force=False):
+        """Recompute summaries with the current parser; return (done, failed)."""
+        if force:
+            rows = self._connect().execute("SELECT document_id, mode FROM documents").fetchall()
+            items = [(doc_id, self.path(doc_id), mode) for doc_id, mode in rows]
+        else:
+            items = self.stale()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for doc_id, summary, error in pool.map(_reparse, items, chunksize=16):
+                if error is not None:
+                    failed += 1
+                    logger.error(f"Re-parsing {doc_id} failed: {error}")
+                    continue
+                self.save_summary(doc_id, summary)
+                done += 1
+        return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the archive of raw OCR responses")
+    parser.add_argument("--dir", default=os.environ.get("ARCHIVE_DIR"), help="archive directory (ARCHIVE_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reparse_p = sub.add_parser("reparse", help=f"summarise stored documents with parser {PARSER_VERSION}")
+    reparse_p.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    reparse_p.add_argument("--force", action="store_true", help="re-parse documents that are already current")
+    args = parser.parse_args(argv)
+
+    if not args.dir:
+        parser.error("set --dir or ARCHIVE_DIR")
+    logging.basicConfig(level=logging.INFO)
+
+    archive = ResponseArchive(args.dir)
+    start = time.monotonic()
+    done, failed = archive.reparse(args.workers, args.force)
+    print(f"Re-parsed {done} documents with parser {PARSER_VERSION} in {time.monotonic() - start:.1f}s"
+          f"{f', {failed} failed' if failed else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Process-wide registry of pooled boto3 clients.
+
+Clients are built lazily on first use and then reused for every request in the
+worker, so credentials, service models and the HTTPS connection pool are only
+set up once. botocore clients are thread-safe, but neither they nor their
+sockets survive a fork, so the registry is dropped in forked children (gunicorn
+prefork) and rebuilt there on demand.
+"""
+import os
+import threading
+import logging
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION = "eu-west-1"
+
+_lock = threading.Lock()
+_clients = {}
+_pid = os.getpid()
+
+
+def _pool_size():
+    """Connections per client: enough for every AWS call a worker process can have in flight.
+
+    That is a full batch (BATCH_CONCURRENCY) plus every job thread
+    (JOB_WORKERS), and never fewer than the adaptive Textract limit can grow
+    to (TEXTRACT_CONCURRENCY_MAX); otherwise calls queue for a connection and
+    urllib3 logs "Connection pool is full". Idle slots cost nothing.
+    """
+    if "AWS_MAX_POOL_CONNECTIONS" in os.environ:
+        return int(os.environ["AWS_MAX_POOL_CONNECTIONS"])
+    threads = int(os.environ.get("BATCH_CONCURRENCY", 8)) + int(os.environ.get("JOB_WORKERS", 4))
+    return max(10, threads, int(os.environ.get("TEXTRACT_CONCURRENCY_MAX", 64)))
+
+
+def _client_config(service_name):
+    config = Config(
+        max_pool_connections=_pool_size(),
+        tcp_keepalive=True,
+        connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", 60)),
+    )
+    if service_name == "textract":
+        # Retries are handled by concurrency.AdaptiveCaller, which also adapts to throttling.
+        config = config.merge(Config(retries={"mode": "standard", "total_max_attempts": 1}))
+    elif service_name == "s3":
+        # Presigned upload URLs must be SigV4; newer regions reject anything else.
+        config = config.merge(Config(signature_version="s3v4"))
+    return config
+
+
+def reset_clients():
+    """Forget every cached client; the next get_client() builds a fresh one."""
+    global _pid
+    with _lock:
+        _clients.clear()
+        _pid = os.getpid()
+
+
+def get_client(service_name, region_name=None):
+    """Return the shared client for ``service_name`` in this process."""
+    region_name = region_name or os.environ.get("AWS_REGION", DEFAULT_REGION)
+    key = (service_name, region_name)
+
+    if _pid != os.getpid():
+        reset_clients()
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            logger.info(f"Creating {service_name} client for {region_name} in pid {os.getpid()}")
+            session = boto3.session.Session(
+                aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                region_name=region_name,
+            )
+            # e.g. AWS_ENDPOINT_URL_TEXTRACT=http://localhost:9000 for fake_textract.py
+            endpoint_url = os.environ.get(f"AWS_ENDPOINT_URL_{service_name.upper()}") or None
+            client = session.client(service_name, config=_client_config(service_name), endpoint_url=endpoint_url)
+            _clients[key] = client
+    return client
+
+
+def get_textract_client():
+    return get_client("textract")
+
+
+def _after_fork():
+    # The parent's lock may have been held mid-fork; start the child clean.
+    global _lock, _pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1 @@
+"""Performance benchmarks for the timesheet pipeline. Run modules with ``python -m``."""
@@ -0,0 +1,96 @@
+"""Peak memory of reading an upload, by upload size.
+
+Parses a multipart POST of each size with the app's ``read_upload`` (spool,
+hash, size check) and then streams the spool the way ``stage_upload`` hands it
+to S3, reporting the peak traced Python memory. With spooling, the peak should
+stay near ``UPLOAD_SPOOL_BYTES`` however large the upload; the old
+``image_file.read()`` is measured alongside for comparison. ``--max-peak-mb``
+turns it into a gate:
+
+    python -m benchmarks.memory --sizes 1,16,64 --max-peak-mb 4
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+DEFAULT_SIZES_MB = (1, 8, 32, 128)
+
+
+def _peak(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def measure(webapp, size):
+    from werkzeug.test import EnvironBuilder
+
+    # Encode the request body up front (werkzeug spools it to disk) so only
+    # the app's handling of it is traced.
+    builder = EnvironBuilder(path="/process", method="POST", content_type="multipart/form-data",
+                             data={"image": (io.BytesIO(os.urandom(size)), "scan.png")})
+    environ = builder.get_environ()
+
+    def request_context():
+        environ["wsgi.input"].seek(0)
+        return webapp.app.request_context(dict(environ))
+
+    def spooled():
+        with request_context(), webapp.read_upload() as upload:
+            stream = upload.stream()
+            while stream.read(64 * 1024):
+                pass
+
+    def buffered():
+        with request_context():
+            webapp.request.files["image"].read()
+
+    try:
+        return {"size_bytes": size, "spooled_peak_bytes": _peak(spooled), "buffered_peak_bytes": _peak(buffered)}
+    finally:
+        builder.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory of upload handling by upload size")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=list(DEFAULT_SIZES_MB),
+                        help="upload sizes in MB")
+    parser.add_argument("--max-peak-mb", type=float, help="fail if any spooled peak exceeds this")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    import logging
+    logging.disable(logging.INFO)
+    import app as webapp
+
+    results = [measure(webapp, mb * 1024 * 1024) for mb in args.sizes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'upload (MB)':>11} {'spooled peak (MB)':>18} {'read() peak (MB)':>17}")
+        for r in results:
+            print(f"{r['size_bytes'] / 2**20:>11.0f} {r['spooled_peak_bytes'] / 2**20:>18.2f} "
+                  f"{r['buffered_peak_bytes'] / 2**20:>17.2f}")
+
+    if args.max_peak_mb is not None:
+        worst = max(r["spooled_peak_bytes"] for r in results) / 2**20
+        if worst > args.max_peak_mb:
+            print(f"Spooled peak {worst:.2f} MB exceeds {args.max_peak_mb} MB", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""How parsing cost grows with response size.
+
+Drives ``timesheet.summarize`` (block indexing, cell assembly and hours
+parsing) over synthetic responses from 10 to 100k blocks and reports the best
+wall time and the peak traced memory per size, plus the local growth exponent
+between sizes (1.0 is linear). ``--max-exponent`` turns it into a gate:
+
+    python -m benchmarks.scaling --misread-rate 0.1 --max-exponent 1.3
+"""
+import argparse
+import gc
+import json
+import math
+import sys
+import time
+import tracemalloc
+
+from synthetic import generate_response, rows_for_blocks
+from timesheet import summarize
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+
+def measure(response, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        summarize(response)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    summarize(response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, cols, words_per_cell, noise_rate, misread_rate, repeat, with_tables=True):
+    results = []
+    for size in sizes:
+        rows = rows_for_blocks(size, cols, words_per_cell)
+        response = generate_response(rows, cols, words_per_cell, noise_rate, misread_rate,
+                                     seed=size, with_tables=with_tables)
+        n_blocks = len(response["Blocks"])
+        seconds, peak = measure(response, repeat if n_blocks < 50_000 else max(1, repeat // 3))
+        results.append({"target": size, "blocks": n_blocks, "rows": rows,
+                        "seconds": seconds, "peak_bytes": peak})
+    for prev, cur in zip(results, results[1:]):
+        cur["exponent"] = (math.log(cur["seconds"] / prev["seconds"])
+                           / math.log(cur["blocks"] / prev["blocks"]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parsing time and memory by response size")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=list(DEFAULT_SIZES))
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--words-per-cell", type=int, default=4)
+    parser.add_argument("--noise-rate", type=float, default=0.0)
+    parser.add_argument("--misread-rate", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--text-only", action="store_true", help="benchmark the geometry (no CELL) path")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-exponent", type=float,
+                        help="fail if time grows faster than blocks**N between sizes of 1000+ blocks")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.cols, args.words_per_cell, args.noise_rate, args.misread_rate,
+                  args.repeat, with_tables=not args.text_only)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'blocks':>8} {'time (ms)':>10} {'us/block':>9} {'peak (KiB)':>11} {'exponent':>9}")
+        for r in results:
+            exponent = f"{r['exponent']:.2f}" if "exponent" in r else "-"
+            print(f"{r['blocks']:>8} {r['seconds'] * 1000:>10.2f} {r['seconds'] / r['blocks'] * 1e6:>9.2f}"
+                  f" {r['peak_bytes'] / 1024:>11.1f} {exponent:>9}")
+
+    if args.max_exponent is not None:
+        # Small sizes are dominated by fixed overhead, so only gate the large ones.
+        bad = [r for r in results if r.get("exponent", 0) > args.max_exponent and r["blocks"] >= 1000]
+        if bad:
+            print(f"Scaling regression: exponent above {args.max_exponent} at "
+                  f"{', '.join(str(r['blocks']) for r in bad)} blocks", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
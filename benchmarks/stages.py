@@ -0,0 +1,198 @@
+"""Per-stage benchmarks of the /process pipeline with stored baselines.
+
+Each stage of a request is timed on its own against a synthetic timesheet:
+
+* ``upload_read``    multipart parsing and ``read_image`` of the upload
+* ``textract_call``  the pooled client round trip to fake_textract (no latency)
+* ``month_detection`` ``detect_month`` over all blocks
+* ``cell_assembly``  ``table_cells`` on a fresh ``BlockGraph``
+* ``time_normalization`` cell entries to per-day seconds
+* ``aggregation``    quarter-hour rounding and the summary
+* ``json_serialization`` ``jsonify`` of the summary
+
+Record a baseline, then gate later runs against it:
+
+    python -m benchmarks.stages run --output benchmarks/baselines/main.json
+    python -m benchmarks.stages run --compare benchmarks/baselines/main.json --threshold 0.15
+
+``compare`` exits non-zero when any stage's median time regressed by more
+than the threshold.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "baseline.json")
+
+
+def _timeit(fn, repeat, min_time=0.05):
+    """Median and best seconds per call over ``repeat`` batches of auto-sized loops."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time or number >= 1_000_000:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {"median_s": statistics.median(samples), "min_s": min(samples),
+            "number": number, "repeat": repeat}
+
+
+def build_stages(rows, cols, upload_bytes):
+    """Stage name -> zero-argument callable, with all inputs prepared up front."""
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+    import fake_textract
+    server = fake_textract.serve(fake_textract.FakeTextract(rows=rows, cols=cols, seed=0), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["AWS_ENDPOINT_URL_TEXTRACT"] = f"http://127.0.0.1:{server.server_port}"
+
+    from flask import jsonify
+
+    import app as webapp
+    from analysis import call_textract
+    from aws_clients import reset_clients
+    from blocks import BlockGraph
+    from features import plan_feature_types
+    from synthetic import generate_response
+    from timesheet import build_summary, detect_month, hours_from_seconds, seconds_by_name, table_cells
+
+    reset_clients()
+    response = generate_response(rows, cols, misread_rate=0.05, seed=1)
+    blocks = response["Blocks"]
+    cells = table_cells(BlockGraph.from_response(response))
+    seconds = seconds_by_name(cells)
+    summary = build_summary(detect_month(blocks), *hours_from_seconds(seconds))
+    image = os.urandom(upload_bytes)
+    feature_types = plan_feature_types()
+
+    def upload_read():
+        data = {"image": (io.BytesIO(image), "sheet.png")}
+        with webapp.app.test_request_context("/process", method="POST", data=data,
+                                             content_type="multipart/form-data"):
+            webapp.read_upload().close()
+
+    def json_serialization():
+        with webapp.app.app_context():
+            jsonify(summary).get_data()
+
+    return {
+        "upload_read": upload_read,
+        "textract_call": lambda: call_textract({"Bytes": image[:1024]}, feature_types),
+        "month_detection": lambda: detect_month(blocks),
+        "cell_assembly": lambda: table_cells(BlockGraph.from_response(response)),
+        "time_normalization": lambda: seconds_by_name(cells),
+        "aggregation": lambda: build_summary("January 2024", *hours_from_seconds(seconds)),
+        "json_serialization": json_serialization,
+    }, server
+
+
+def run(rows, cols, upload_bytes, repeat, only=None):
+    import logging
+    logging.disable(logging.INFO)
+
+    stages, server = build_stages(rows, cols, upload_bytes)
+    try:
+        results = {name: _timeit(fn, repeat) for name, fn in stages.items() if not only or name in only}
+    finally:
+        server.shutdown()
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "rows": rows,
+            "cols": cols,
+            "upload_bytes": upload_bytes,
+        },
+        "stages": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print a comparison table; return the names of stages that regressed."""
+    regressed = []
+    print(f"{'stage':<20} {'baseline (us)':>14} {'current (us)':>13} {'change':>8}")
+    for name, cur in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            print(f"{name:<20} {'-':>14} {cur['median_s'] * 1e6:>13.1f} {'new':>8}")
+            continue
+        change = cur["median_s"] / base["median_s"] - 1
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:<20} {base['median_s'] * 1e6:>14.1f} {cur['median_s'] * 1e6:>13.1f} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage benchmarks of /process")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="run the benchmarks and write results")
+    run_p.add_argument("--rows", type=int, default=40)
+    run_p.add_argument("--cols", type=int, default=8)
+    run_p.add_argument("--upload-bytes", type=int, default=1024 * 1024)
+    run_p.add_argument("--repeat", type=int, default=7)
+    run_p.add_argument("--stage", action="append", help="only run the named stage(s)")
+    run_p.add_argument("--output", help=f"where to write results (default {DEFAULT_BASELINE} "
+                                        "unless --compare is given)")
+    run_p.add_argument("--compare", metavar="BASELINE", help="compare with a stored baseline")
+    run_p.add_argument("--threshold", type=float, default=0.10,
+                       help="allowed relative slowdown per stage (default 0.10)")
+
+    cmp_p = sub.add_parser("compare", help="compare two stored result files")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        regressed = compare(_load(args.baseline), _load(args.current), args.threshold)
+    else:
+        results = run(args.rows, args.cols, args.upload_bytes, args.repeat, args.stage)
+        output = args.output or (None if args.compare else DEFAULT_BASELINE)
+        if output:
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            with open(output, "w", encoding="utf-8") as fh:
+                json.dump(results, fh, indent=2)
+            print(f"Wrote {output}")
+        if not args.compare:
+            for name, r in results["stages"].items():
+                print(f"{name:<20} {r['median_s'] * 1e6:>12.1f} us")
+            return 0
+        regressed = compare(_load(args.compare), results, args.threshold)
+
+    if regressed:
+        print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Cell time parsing: the single-pass scanner against the regex implementation.
+
+First checks that ``timesheet.entry_seconds`` (time_tokens.py) gives exactly
+what ``timesheet.reference_entry_seconds`` gives, on every cell of a large
+synthetic sheet with misreads and noise and on random fuzz strings built from
+digits, misread characters, separators, glued IN/OUT markers, odd whitespace
+and the occasional non-ASCII character; any difference is printed and fails
+the run. Then times both over the sheet's cells:
+
+    python -m benchmarks.time_tokens --rows 5000 --fuzz 200000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from blocks import BlockGraph
+from synthetic import generate_response
+from timesheet import entry_seconds, reference_entry_seconds, table_cells
+
+FUZZ_PIECES = ("0", "1", "2", "3", "5", "7", "9", "12", "23", "24", "59", "60", "99",
+               "!", "I", "l", "|", "O", "o", ":", "%", ";", ",", ".",
+               "IN", "OUT", "INOUT", "N", "U", "T", "x", "~", "-",
+               " ", " ", "  ", "\t", "\n", "\x1c", "\xa0", "٣", "é")
+
+
+def sheet_entries(rows, cols, words_per_cell, noise_rate, misread_rate, seed=0):
+    response = generate_response(rows, cols, words_per_cell, noise_rate, misread_rate, seed=seed)
+    cells = table_cells(BlockGraph.from_response(response))
+    return [text for c in cells.values() for col, text in c.items() if col != 1]
+
+
+def fuzz_entries(n, seed=0):
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(FUZZ_PIECES) for _ in range(rnd.randint(0, 12))) for _ in range(n)]
+
+
+def differences(entries):
+    """(entry, scanner result, reference result) wherever the two disagree."""
+    diffs = []
+    for entry in entries:
+        fast, reference = entry_seconds(entry), reference_entry_seconds(entry)
+        if fast != reference or type(fast) is not type(reference):
+            diffs.append((entry, fast, reference))
+    return diffs
+
+
+def best_time(fn, entries, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for entry in entries:
+            fn(entry)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential check and timing of cell time parsing")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--words-per-cell", type=int, default=8)
+    parser.add_argument("--noise-rate", type=float, default=0.1)
+    parser.add_argument("--misread-rate", type=float, default=0.1)
+    parser.add_argument("--fuzz", type=int, default=100_000, help="random strings to check")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    entries = sheet_entries(args.rows, args.cols, args.words_per_cell, args.noise_rate, args.misread_rate)
+    diffs = differences(entries) + differences(fuzz_entries(args.fuzz))
+    if diffs:
+        for entry, fast, reference in diffs[:20]:
+            print(f"{entry!r}: scanner {fast!r}, reference {reference!r}", file=sys.stderr)
+        print(f"{len(diffs)} entries differ", file=sys.stderr)
+        return 1
+
+    reference = best_time(reference_entry_seconds, entries, args.repeat)
+    scanner = best_time(entry_seconds, entries, args.repeat)
+    result = {"cells": len(entries), "checked": len(entries) + args.fuzz,
+              "reference_seconds": reference, "scanner_seconds": scanner, "speedup": reference / scanner}
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['checked']} entries identical")
+        print(f"{'parser':>10} {'time (ms)':>10} {'us/cell':>8}")
+        for name, seconds in (("reference", reference), ("scanner", scanner)):
+            print(f"{name:>10} {seconds * 1000:>10.2f} {seconds / len(entries) * 1e6:>8.2f}")
+        print(f"speedup {result['speedup']:.1f}x over {len(entries)} cells")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
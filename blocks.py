@@ -0,0 +1,96 @@
+"""Id-indexed view over the Blocks list of a Textract response."""
+
+
+class BlockGraph:
+    """Indexes Textract blocks by Id so relationships resolve in O(1).
+
+    The index and the reverse (child -> parent) map are built once, so walking
+    every CELL and its WORD children is linear in the size of the response.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        self._by_id = {}
+        self._by_type = {}
+        self._parents = {}
+
+        for block in self.blocks:
+            block_id = block.get("Id")
+            if block_id is not None:
+                self._by_id[block_id] = block
+            self._by_type.setdefault(block.get("BlockType"), []).append(block)
+
+        for block in self.blocks:
+            for rel in block.get("Relationships", []):
+                for cid in rel.get("Ids", []):
+                    self._parents.setdefault((cid, rel["Type"]), []).append(block)
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.get("Blocks", []))
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self._by_id
+
+    def get(self, block_id, default=None):
+        return self._by_id.get(block_id, default)
+
+    def of_type(self, block_type):
+        return self._by_type.get(block_type, [])
+
+    def related(self, block, rel_type):
+        """Blocks referenced from ``block`` by relationships of ``rel_type``."""
+        found = []
+        for rel in block.get("Relationships", []):
+            if rel["Type"] != rel_type:
+                continue
+            for cid in rel.get("Ids", []):
+                child = self._by_id.get(cid)
+                if child is not None:
+                    found.append(child)
+        return found
+
+    def children(self, block, block_type=None):
+        kids = self.related(block, "CHILD")
+        if block_type is None:
+            return kids
+        return [b for b in kids if b.get("BlockType") == block_type]
+
+    def parents(self, block, rel_type="CHILD"):
+        return self._parents.get((block.get("Id"), rel_type), [])
+
+    def parent(self, block, block_type=None):
+        for p in self.parents(block):
+            if block_type is None or p.get("BlockType") == block_type:
+                return p
+        return None
+
+    def words(self, block):
+        return self.children(block, "WORD")
+
+    def text(self, block):
+        return ' '.join(w.get("Text", '') for w in self.words(block)).strip()
+
+    def walk(self, block):
+        """Depth-first iteration over ``block`` and all of its descendants."""
+        seen = set()
+        stack = [block]
+        while stack:
+            current = stack.pop()
+            cid = current.get("Id")
+            if cid in seen:
+                continue
+            seen.add(cid)
+            yield current
+            stack.extend(reversed(self.children(current)))
+
+    def cells(self):
+        """Table cells as ``{row: {col: text}}``, matching the parser's layout."""
+        cells = {}
+        for block in self.of_type("CELL"):
+            r, c = block["RowIndex"], block["ColumnIndex"]
+            cells.setdefault(r, {})[c] = self.text(block)
+        return cells
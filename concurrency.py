@@ -0,0 +1,182 @@
+"""Adaptive concurrency and retries for Textract calls.
+
+The usable concurrency against Textract depends on the account's quota, the
+other workers sharing it and the service's current latency, so instead of a
+fixed number each process discovers it AIMD-style: every success adds about
+one slot per window of calls, while a throttle halves the limit and a call
+much slower than the recent average for its operation trims it. Failed calls
+that are worth retrying are retried with decorrelated jitter until the
+request's deadline.
+"""
+import os
+import random
+import threading
+import time
+import logging
+from contextvars import ContextVar
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_CODES = ("ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException")
+RETRYABLE_CODES = THROTTLE_CODES + ("InternalServerError", "ServiceUnavailable", "ServiceUnavailableException")
+
+_deadline = ContextVar("textract_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def set_deadline(seconds):
+    """Give every Textract call in the current request ``seconds`` in total."""
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def clear_deadline(token):
+    _deadline.reset(token)
+
+
+def error_code(exc):
+    if isinstance(exc, ClientError):
+        return exc.response.get("Error", {}).get("Code", "Unknown")
+    return type(exc).__name__
+
+
+def is_throttle(exc):
+    return isinstance(exc, ClientError) and error_code(exc) in THROTTLE_CODES
+
+
+def is_retryable(exc):
+    if isinstance(exc, ClientError):
+        status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error_code(exc) in RETRYABLE_CODES or status >= 500
+    return isinstance(exc, (BotoConnectionError, HTTPClientError))
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=4, minimum=1, maximum=64, latency_tolerance=2.0, decrease_interval=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        # Per operation: a quick GetDocumentAnalysis poll says nothing about
+        # how long an AnalyzeDocument call should take.
+        self.avg_latency = {}
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            initial=int(os.environ.get("TEXTRACT_CONCURRENCY_INITIAL", 4)),
+            minimum=int(os.environ.get("TEXTRACT_CONCURRENCY_MIN", 1)),
+            maximum=int(os.environ.get("TEXTRACT_CONCURRENCY_MAX", 64)),
+            latency_tolerance=float(os.environ.get("TEXTRACT_LATENCY_TOLERANCE", 2.0)),
+        )
+
+    def acquire(self, deadline):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded("Timed out waiting for a Textract concurrency slot")
+                self._cond.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False, operation=None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease(0.5)
+            elif latency is not None:
+                avg = self.avg_latency.get(operation)
+                if avg is not None and latency > avg * self.latency_tolerance:
+                    self._decrease(0.9)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                # Slow moving average so one outlier does not redefine "normal".
+                self.avg_latency[operation] = latency if avg is None else 0.95 * avg + 0.05 * latency
+            self._cond.notify_all()
+
+    def _decrease(self, factor):
+        # Many calls in flight see the same overload; react to it once per interval.
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * factor)
+        logger.info(f"Textract concurrency limit lowered to {self.limit:.1f}")
+
+
+class RetryPolicy:
+    """Decorrelated jitter: each sleep is uniform between ``base`` and three times the last."""
+
+    def __init__(self, base=0.1, cap=5.0, max_attempts=6, default_deadline=30.0):
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+        self.default_deadline = default_deadline
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            base=float(os.environ.get("TEXTRACT_RETRY_BASE", 0.1)),
+            cap=float(os.environ.get("TEXTRACT_RETRY_CAP", 5.0)),
+            max_attempts=int(os.environ.get("TEXTRACT_MAX_ATTEMPTS", 6)),
+            default_deadline=float(os.environ.get("TEXTRACT_DEADLINE", 30.0)),
+        )
+
+    def deadline(self):
+        deadline = _deadline.get()
+        return deadline if deadline is not None else time.monotonic() + self.default_deadline
+
+    def next_sleep(self, previous):
+        return min(self.cap, random.uniform(self.base, previous * 3))
+
+
+class AdaptiveCaller:
+    def __init__(self, limiter, policy, on_retry=None):
+        self.limiter = limiter
+        self.policy = policy
+        self.on_retry = on_retry
+
+    @classmethod
+    def from_env(cls, on_retry=None):
+        return cls(AdaptiveLimiter.from_env(), RetryPolicy.from_env(), on_retry)
+
+    def call(self, fn, operation=None, before=None):
+        """Run ``fn`` within a concurrency slot, retrying transient failures until the deadline.
+
+        ``before`` runs ahead of each attempt, outside the slot and the timing
+        (waiting for a rate-limit token is not Textract being slow);
+        ``operation`` picks the latency average the attempt is judged against.
+        """
+        deadline = self.policy.deadline()
+        sleep = self.policy.base
+        attempt = 0
+        while True:
+            attempt += 1
+            if before is not None:
+                before()
+            self.limiter.acquire(deadline)
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                self.limiter.release(throttled=is_throttle(e), operation=operation)
+                if not is_retryable(e) or attempt >= self.policy.max_attempts:
+                    raise
+                sleep = self.policy.next_sleep(sleep)
+                if time.monotonic() + sleep >= deadline:
+                    raise
+                if self.on_retry is not None:
+                    self.on_retry(error_code(e))
+                logger.info(f"Retrying Textract call after {error_code(e)} in {sleep:.2f}s (attempt {attempt})")
+                time.sleep(sleep)
+                continue
+            self.limiter.release(latency=time.monotonic() - start, operation=operation)
+            return result
@@ -0,0 +1,79 @@
+"""Presigned direct-to-S3 uploads.
+
+Instead of posting the image through a web worker, a client asks for a
+presigned POST (or PUT) to a fresh key under UPLOAD_PREFIX, sends the file
+straight to S3, and then asks for the analysis of that key, which Textract
+reads from S3 itself. Workers only ever see small JSON requests, however
+slow the client's connection.
+
+Uploaded objects are left in place so a completion can be retried; expire
+the prefix with an S3 lifecycle rule.
+"""
+import os
+import re
+import uuid
+import logging
+
+from botocore.exceptions import ClientError
+
+from analysis import STAGING_BUCKET
+from aws_clients import get_client
+from uploads import MAX_BYTES, check_filename
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BUCKET = os.environ.get("UPLOAD_BUCKET", STAGING_BUCKET)
+UPLOAD_PREFIX = os.environ.get("UPLOAD_PREFIX", "uploads/")
+UPLOAD_URL_EXPIRES = int(os.environ.get("UPLOAD_URL_EXPIRES", 900))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}\.[a-z]{3,4}$")
+
+
+class UploadNotFound(LookupError):
+    pass
+
+
+def upload_key(upload_id):
+    """S3 key of an upload id handed out by ``presign_upload``."""
+    if not _UPLOAD_ID.match(upload_id or ''):
+        raise UploadNotFound(f"Unknown upload id: {upload_id}")
+    return f"{UPLOAD_PREFIX}{upload_id}"
+
+
+def presign_upload(filename, content_type=None):
+    """A new upload id with presigned POST and PUT requests for it."""
+    check_filename(filename)
+    upload_id = uuid.uuid4().hex + os.path.splitext(filename)[1].lower()
+    key = upload_key(upload_id)
+    s3 = get_client("s3")
+
+    fields = {}
+    conditions = [["content-length-range", 1, MAX_BYTES]]
+    params = {"Bucket": UPLOAD_BUCKET, "Key": key}
+    if content_type:
+        fields["Content-Type"] = content_type
+        conditions.append({"Content-Type": content_type})
+        params["ContentType"] = content_type
+
+    post = s3.generate_presigned_post(UPLOAD_BUCKET, key, Fields=fields, Conditions=conditions,
+                                      ExpiresIn=UPLOAD_URL_EXPIRES)
+    put_url = s3.generate_presigned_url("put_object", Params=params, ExpiresIn=UPLOAD_URL_EXPIRES)
+    logger.info(f"Presigned upload {upload_id} for {filename}")
+    return {
+        "upload_id": upload_id,
+        "bucket": UPLOAD_BUCKET,
+        "key": key,
+        "expires_in": UPLOAD_URL_EXPIRES,
+        "post": {"url": post["url"], "fields": post["fields"]},
+        "put": {"url": put_url, "headers": {"Content-Type": content_type} if content_type else {}},
+    }
+
+
+def head_upload(key):
+    """HEAD of an uploaded object; UploadNotFound if the client never uploaded it."""
+    try:
+        return get_client("s3").head_object(Bucket=UPLOAD_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            raise UploadNotFound(f"Nothing has been uploaded to {key} yet.")
+        raise
@@ -0,0 +1,210 @@
+"""Local stand-in for the Textract API, for offline and load testing.
+
+Speaks the same JSON 1.1 protocol as Textract, so the app (or any boto3
+client) can be pointed at it with AWS_ENDPOINT_URL_TEXTRACT:
+
+    python fake_textract.py --port 9000 --responses recorded/ \\
+        --latency lognormal:-0.5,0.4 --throttle-rate 0.05 --error-rate 0.01
+    AWS_ENDPOINT_URL_TEXTRACT=http://localhost:9000 gunicorn app:app
+
+Responses are looked up by the SHA-256 of the document bytes in the
+``--responses`` directory (``<sha256>.<features>.json`` as written by
+replay.py's record mode, then ``<sha256>.json``); anything else gets a
+synthetic timesheet from synthetic.py. Latency is drawn from the configured
+distribution and a share of calls can be failed with throttling or internal
+errors. GET /stats returns call counters.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from replay import without_recording
+from synthetic import generate_response
+
+logger = logging.getLogger("fake_textract")
+
+THROTTLE_ERRORS = ("ThrottlingException", "ProvisionedThroughputExceededException")
+
+
+def parse_latency(spec):
+    """Sampler for a latency spec in seconds, e.g. ``fixed:0.5``, ``uniform:0.2,1``,
+    ``normal:1,0.2``, ``lognormal:-0.5,0.4`` or ``exp:0.8``."""
+    kind, _, args = spec.partition(":")
+    params = [float(a) for a in args.split(",") if a]
+    if kind == "fixed":
+        return lambda rnd: params[0]
+    if kind == "uniform":
+        return lambda rnd: rnd.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda rnd: max(0.0, rnd.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda rnd: rnd.lognormvariate(params[0], params[1])
+    if kind == "exp":
+        return lambda rnd: rnd.expovariate(1 / params[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeTextract:
+    """Request handling state shared by the server's handler threads."""
+
+    def __init__(self, responses_dir=None, latency="fixed:0", throttle_rate=0.0, error_rate=0.0,
+                 rows=12, cols=8, misread_rate=0.0, seed=None):
+        self.responses_dir = responses_dir
+        self.sample_latency = parse_latency(latency)
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rows = rows
+        self.cols = cols
+        self.misread_rate = misread_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.synthetic = {}
+        self.stats = {"calls": 0, "throttled": 0, "errors": 0, "recorded": 0, "synthetic": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _document_response(self, document, with_tables, feature_types=()):
+        data = base64.b64decode(document["Bytes"]) if "Bytes" in document else \
+            json.dumps(document.get("S3Object", {}), sort_keys=True).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        if self.responses_dir:
+            features = ",".join(sorted(feature_types)) or "TEXT"
+            for name in (f"{digest}.{features}.json", f"{digest}.json"):
+                path = os.path.join(self.responses_dir, name)
+                if os.path.exists(path):
+                    self._count("recorded")
+                    with open(path, encoding="utf-8") as fh:
+                        return without_recording(json.load(fh))
+        self._count("synthetic")
+        key = (digest, with_tables)
+        response = self.synthetic.get(key)
+        if response is None:
+            response = generate_response(self.rows, self.cols, misread_rate=self.misread_rate,
+                                         seed=int(digest[:8], 16), with_tables=with_tables)
+            with self.lock:
+                if len(self.synthetic) >= 256:
+                    self.synthetic.clear()
+                self.synthetic[key] = response
+        return response
+
+    def handle(self, operation, body):
+        """(status, payload) for one API call, after simulated latency and faults."""
+        self._count("calls")
+        with self.lock:
+            delay = self.sample_latency(self.rnd)
+            roll = self.rnd.random()
+        time.sleep(delay)
+
+        if roll < self.throttle_rate:
+            self._count("throttled")
+            return 400, {"__type": self.rnd.choice(THROTTLE_ERRORS), "message": "Rate exceeded"}
+        if roll < self.throttle_rate + self.error_rate:
+            self._count("errors")
+            return 500, {"__type": "InternalServerError", "message": "Simulated failure"}
+
+        if operation in ("AnalyzeDocument", "DetectDocumentText"):
+            return 200, self._document_response(body["Document"], operation == "AnalyzeDocument",
+                                                body.get("FeatureTypes", ()))
+
+        if operation in ("StartDocumentAnalysis", "StartDocumentTextDetection"):
+            job_id = uuid.uuid4().hex
+            response = self._document_response(body["DocumentLocation"], operation == "StartDocumentAnalysis",
+                                               body.get("FeatureTypes", ()))
+            with self.lock:
+                self.jobs[job_id] = response
+            return 200, {"JobId": job_id}
+
+        if operation in ("GetDocumentAnalysis", "GetDocumentTextDetection"):
+            with self.lock:
+                response = self.jobs.get(body["JobId"])
+            if response is None:
+                return 400, {"__type": "InvalidJobIdException", "message": "Unknown JobId"}
+            start = int(body.get("NextToken") or 0)
+            size = int(body.get("MaxResults") or 1000)
+            page = {"JobStatus": "SUCCEEDED", "DocumentMetadata": response.get("DocumentMetadata", {}),
+                    "Blocks": response["Blocks"][start:start + size]}
+            if start + size < len(response["Blocks"]):
+                page["NextToken"] = str(start + size)
+            return 200, page
+
+        return 400, {"__type": "UnknownOperationException", "message": f"Unsupported operation {operation}"}
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("x-amzn-RequestId", uuid.uuid4().hex)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with fake.lock:
+                    self._send(200, dict(fake.stats))
+            else:
+                self._send(404, {"message": "Not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            operation = self.headers.get("X-Amz-Target", "").rpartition(".")[2]
+            status, payload = fake.handle(operation, body)
+            self._send(status, payload)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return Handler
+
+
+def serve(fake, host="127.0.0.1", port=9000):
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--responses", help="directory of recorded <sha256>.json responses")
+    parser.add_argument("--latency", default="fixed:0", help="latency distribution in seconds")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rows", type=int, default=12, help="rows in synthetic timesheets")
+    parser.add_argument("--cols", type=int, default=8, help="columns in synthetic timesheets")
+    parser.add_argument("--misread-rate", type=float, default=0.0,
+                        help="share of time characters replaced with typical OCR misreads")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeTextract(args.responses, args.latency, args.throttle_rate, args.error_rate,
+                        args.rows, args.cols, args.misread_rate, args.seed)
+    server = serve(fake, args.host, args.port)
+    logger.info(f"Fake Textract listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
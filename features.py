@@ -0,0 +1,48 @@
+"""Chooses the smallest set of Textract FeatureTypes an extraction profile needs.
+
+Every feature type adds latency, response size and per-page cost, so requests
+ask only for the block types their parser reads. WORD and LINE blocks come
+back from every Textract call; an empty plan means plain text detection is
+enough.
+"""
+import os
+
+# Block types that only appear when the given feature type is requested.
+FEATURE_BLOCK_TYPES = {
+    "TABLES": ("TABLE", "CELL", "MERGED_CELL", "TABLE_TITLE", "TABLE_FOOTER"),
+    "FORMS": ("KEY_VALUE_SET", "SELECTION_ELEMENT"),
+    "QUERIES": ("QUERY", "QUERY_RESULT"),
+    "SIGNATURES": ("SIGNATURE",),
+}
+
+# Block types each parser consumes.
+PROFILES = {
+    "timesheet": ("WORD", "LINE", "CELL"),
+    # Table grid rebuilt from word geometry (see table_geometry.py).
+    "timesheet-geometry": ("WORD", "LINE"),
+}
+
+DEFAULT_PROFILE = os.environ.get("EXTRACTION_PROFILE", "timesheet")
+
+
+class UnknownProfile(ValueError):
+    pass
+
+
+def plan_feature_types(profile=None):
+    """FeatureTypes for ``profile``, honouring a TEXTRACT_FEATURES_<PROFILE> override.
+
+    Dashes become underscores in the variable name, since shells cannot export
+    TEXTRACT_FEATURES_TIMESHEET-GEOMETRY.
+    """
+    profile = profile or DEFAULT_PROFILE
+
+    override = os.environ.get(f"TEXTRACT_FEATURES_{profile.upper().replace('-', '_')}")
+    if override is not None:
+        return sorted({f.strip().upper() for f in override.split(",") if f.strip()})
+
+    if profile not in PROFILES:
+        raise UnknownProfile(f"Unknown extraction profile: {profile}")
+    needed = set(PROFILES[profile])
+    return sorted(feature for feature, block_types in FEATURE_BLOCK_TYPES.items()
+                  if needed.intersection(block_types))
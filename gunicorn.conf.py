@@ -0,0 +1,7 @@
+# Used automatically by `gunicorn app:app` when run from this directory.
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of workers that exit so /metrics stops counting them.
+    multiprocess.mark_process_dead(worker.pid)
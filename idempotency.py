@@ -0,0 +1,186 @@
+"""Idempotency-Key handling for POST /process.
+
+A client that retries an upload with the same Idempotency-Key gets the first
+completed result back instead of triggering another billed analysis. The
+first request for a key claims it; duplicates that arrive while it is still
+running poll the store until the result lands, and only take over if the
+original fails (its claim is released) or its worker died (the claim's lease
+ran out). Completed results are kept for a TTL.
+
+The store is shared by every gunicorn worker (SQLite by default), so a retry
+that lands on a different worker is still recognised.
+"""
+import json
+import os
+import time
+import logging
+
+import stores
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+MAX_KEY_LENGTH = 255
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+class KeyReused(Exception):
+    """The key was already used for a different request."""
+
+
+class StillProcessing(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class IdempotencyStore:
+    """Interface for idempotency records."""
+
+    def claim(self, key, fingerprint, lease):
+        """Claim ``key`` for ``lease`` seconds; return None on success, else the existing record."""
+        raise NotImplementedError
+
+    def complete(self, key, result, ttl):
+        raise NotImplementedError
+
+    def release(self, key):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore, stores.MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self._records = {}
+
+    def claim(self, key, fingerprint, lease):
+        now = time.time()
+        with self._lock:
+            for k in [k for k, r in self._records.items() if r["expires_at"] <= now]:
+                del self._records[k]
+            record = self._records.get(key)
+            if record is not None:
+                return dict(record)
+            self._records[key] = {"fingerprint": fingerprint, "status": IN_PROGRESS,
+                                  "result": None, "expires_at": now + lease}
+            return None
+
+    def complete(self, key, result, ttl):
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                record.update(status=COMPLETED, result=result, expires_at=time.time() + ttl)
+
+    def release(self, key):
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record["status"] == IN_PROGRESS:
+                del self._records[key]
+
+
+class SQLiteIdempotencyStore(IdempotencyStore, stores.SQLiteStore):
+    def __init__(self, path):
+        super().__init__(path, [
+            "CREATE TABLE IF NOT EXISTS idempotency ("
+            " key TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " expires_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idempotency_expires_at ON idempotency (expires_at)",
+        ])
+
+    def claim(self, key, fingerprint, lease):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO idempotency (key, fingerprint, status, expires_at) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, IN_PROGRESS, now + lease),
+            ).rowcount
+            if inserted:
+                return None
+            row = conn.execute(
+                "SELECT fingerprint, status, result, expires_at FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+        return {
+            "fingerprint": row[0],
+            "status": row[1],
+            "result": json.loads(row[2]) if row[2] is not None else None,
+            "expires_at": row[3],
+        }
+
+    def complete(self, key, result, ttl):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE idempotency SET status = ?, result = ?, expires_at = ? WHERE key = ?",
+                (COMPLETED, json.dumps(result), time.time() + ttl, key),
+            )
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM idempotency WHERE key = ? AND status = ?", (key, IN_PROGRESS))
+
+
+def store_from_env():
+    return stores.store_from_env("IDEMPOTENCY", MemoryIdempotencyStore, SQLiteIdempotencyStore,
+                                 "textract-idempotency.sqlite3")
+
+
+class Idempotency:
+    """Runs a request's work at most once per key while its result is remembered.
+
+    ``ttl`` is how long completed results are replayed, ``lease`` how long an
+    unfinished claim blocks others (longer than the slowest analysis) and
+    ``wait`` how long a duplicate waits for the original before giving up.
+    """
+
+    def __init__(self, store, ttl=86400, lease=900, wait=60):
+        self.store = store
+        self.ttl = ttl
+        self.lease = lease
+        self.wait = wait
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            store_from_env(),
+            ttl=float(os.environ.get("IDEMPOTENCY_TTL", 86400)),
+            lease=float(os.environ.get("IDEMPOTENCY_LEASE", 900)),
+            wait=float(os.environ.get("IDEMPOTENCY_WAIT", 60)),
+        )
+
+    def run(self, key, fingerprint, fn):
+        """Result of ``fn()`` for ``key``, computing it only if no other request has; return (result, replayed)."""
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise InvalidKey(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.")
+
+        deadline = time.monotonic() + self.wait
+        delay = 0.05
+        while True:
+            record = self.store.claim(key, fingerprint, self.lease)
+            if record is None:
+                break
+            if record["fingerprint"] != fingerprint:
+                raise KeyReused("Idempotency-Key was already used for a different request.")
+            if record["status"] == COMPLETED:
+                logger.info(f"Replaying result for Idempotency-Key {key}")
+                return record["result"], True
+            if time.monotonic() + delay > deadline:
+                raise StillProcessing("A request with this Idempotency-Key is still being processed.", 5)
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+        try:
+            result = fn()
+        except BaseException:
+            # Failures are not remembered, so a retry gets a fresh attempt.
+            self.store.release(key)
+            raise
+        self.store.complete(key, result, self.ttl)
+        return result, False
@@ -0,0 +1,196 @@
+"""Background analysis jobs: a bounded worker pool plus a pluggable state store.
+
+Web workers only enqueue work and read job state, so a slow Textract round
+trip never holds a request open. Job state lives in a store shared by every
+gunicorn worker (SQLite by default), so any worker can answer a poll.
+
+Finished jobs are kept for JOB_TTL seconds. A job still queued or running
+JOB_LEASE seconds after its last update is reported as failed: the worker
+that held it was recycled or killed, and nothing will ever finish it.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import stores
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+LOST = "Job was lost before it finished; submit it again."
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """Interface for job state."""
+
+    def create(self, job_id, ttl, lease):
+        """Record a queued job, first expiring finished jobs older than ``ttl`` and failing lost ones."""
+        raise NotImplementedError
+
+    def update(self, job_id, status, result=None, error=None):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore, stores.MemoryStore):
+    def __init__(self):
+        super().__init__()
+        self._jobs = {}
+
+    def create(self, job_id, ttl, lease):
+        now = time.time()
+        with self._lock:
+            for job in list(self._jobs.values()):
+                if job["status"] in (SUCCEEDED, FAILED) and job["updated_at"] <= now - ttl:
+                    del self._jobs[job["job_id"]]
+                elif job["status"] in (QUEUED, RUNNING) and job["updated_at"] <= now - lease:
+                    job.update(status=FAILED, error=LOST, updated_at=now)
+            self._jobs[job_id] = {"job_id": job_id, "status": QUEUED, "result": None,
+                                  "error": None, "created_at": now, "updated_at": now}
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(status=status, result=result, error=error, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore(JobStore, stores.SQLiteStore):
+    def __init__(self, path):
+        super().__init__(path, [
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)",
+        ])
+
+    def create(self, job_id, ttl, lease):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at <= ?",
+                         (SUCCEEDED, FAILED, now - ttl))
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)"
+                         " AND updated_at <= ?", (FAILED, LOST, now, QUEUED, RUNNING, now - lease))
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, now, now),
+            )
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT job_id, status, result, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "result": json.loads(row[2]) if row[2] is not None else None,
+            "error": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+
+def store_from_env():
+    return stores.store_from_env("JOB", MemoryJobStore, SQLiteJobStore, "textract-jobs.sqlite3")
+
+
+class JobQueue:
+    """Runs submitted callables on a bounded thread pool and records their outcome.
+
+    ``ttl`` is how long finished jobs are kept and ``lease`` how long a job may
+    go without an update (longer than the slowest job plus its wait in the
+    queue) before it counts as lost.
+    """
+
+    def __init__(self, store, max_workers=4, max_pending=32, ttl=86400, lease=1800):
+        self.store = store
+        self.ttl = ttl
+        self.lease = lease
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            store_from_env(),
+            max_workers=int(os.environ.get("JOB_WORKERS", 4)),
+            max_pending=int(os.environ.get("JOB_MAX_PENDING", 32)),
+            ttl=float(os.environ.get("JOB_TTL", 86400)),
+            lease=float(os.environ.get("JOB_LEASE", 1800)),
+        )
+
+    def _pool(self):
+        # Threads do not survive fork, so each worker process starts its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="job")
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` and return the new job id."""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("Too many jobs in progress, try again later.")
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, self.ttl, self.lease)
+            self._pool().submit(self._run, job_id, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        try:
+            self.store.update(job_id, RUNNING)
+            result = fn(*args, **kwargs)
+            self.store.update(job_id, SUCCEEDED, result=result)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.update(job_id, FAILED, error=str(e))
+        finally:
+            self._slots.release()
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        if job is not None and job["status"] in (QUEUED, RUNNING) and job["updated_at"] <= time.time() - self.lease:
+            logger.warning(f"Job {job_id} was lost in {job['status']} state")
+            self.store.update(job_id, FAILED, error=LOST)
+            job = self.store.get(job_id)
+        return job
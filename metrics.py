@@ -0,0 +1,103 @@
+"""Prometheus metrics for the API and its Textract calls.
+
+Under gunicorn every worker is a separate process, so set
+PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before the workers
+start: each process then writes its samples there and /metrics merges them
+(see gunicorn.conf.py for cleaning up after dead workers). Without it the
+metrics only describe the process that answers the scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+from concurrency import error_code, is_throttle
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route, method and status.",
+    ["route", "method", "status"])
+http_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ["route"], buckets=LATENCY_BUCKETS)
+http_in_flight = Gauge(
+    "http_requests_in_flight", "Requests currently being handled.",
+    ["route"], multiprocess_mode="livesum")
+stage_latency = Histogram(
+    "request_stage_duration_seconds", "Time spent in each stage of a request.",
+    ["route", "stage"], buckets=LATENCY_BUCKETS)
+upload_bytes = Counter(
+    "upload_bytes_total", "Bytes of uploaded images received.")
+
+textract_calls = Counter(
+    "textract_calls_total", "Textract API calls by operation.",
+    ["operation"])
+textract_latency = Histogram(
+    "textract_call_duration_seconds", "Textract API call latency by operation.",
+    ["operation"], buckets=LATENCY_BUCKETS)
+textract_errors = Counter(
+    "textract_errors_total", "Failed Textract API calls by operation and error code.",
+    ["operation", "code"])
+textract_throttles = Counter(
+    "textract_throttles_total", "Throttled Textract API calls by error code.",
+    ["code"])
+
+textract_retries = Counter(
+    "textract_retries_total", "Textract calls retried, by the error that caused the retry.",
+    ["code"])
+
+textract_coalesced = Counter(
+    "textract_coalesced_total", "Analyses answered by sharing an identical one already in flight.")
+
+ocr_requests = Counter(
+    "ocr_requests_total", "Uploads sent to each OCR backend, by result (ok or fallback).",
+    ["backend", "result"])
+
+cache_lookups = Counter(
+    "cache_lookups_total", "Response cache lookups by cache and result (hit or miss).",
+    ["cache", "result"])
+
+
+def record_retry(code):
+    textract_retries.labels(code).inc()
+
+
+def record_coalesced():
+    textract_coalesced.inc()
+
+
+def record_ocr(backend, result):
+    ocr_requests.labels(backend, result).inc()
+
+
+def record_cache(cache, hit):
+    cache_lookups.labels(cache, "hit" if hit else "miss").inc()
+
+
+@contextmanager
+def observe_textract(operation):
+    """Count, time and classify the errors of one Textract API call."""
+    textract_calls.labels(operation).inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        code = error_code(e)
+        textract_errors.labels(operation, code).inc()
+        if is_throttle(e):
+            textract_throttles.labels(code).inc()
+        raise
+    finally:
+        textract_latency.labels(operation).observe(time.perf_counter() - start)
+
+
+def render():
+    """(body, content type) of the current metrics, merged across workers when configured."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
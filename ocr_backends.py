@@ -0,0 +1,219 @@
+"""Pluggable OCR backends and the router that picks one per upload.
+
+Every backend returns a Textract-shaped response (PAGE, LINE and WORD blocks,
+plus TABLE/CELL when it has them), which is the model ``blocks.BlockGraph``
+and the timesheet parser already read, so the parser does not care where the
+blocks came from. Two backends ship:
+
+* ``textract``  the existing cached, rate-limited Textract path
+* ``tesseract`` local Tesseract in a process pool (tesseract_ocr.py); single
+  page images only, with the table grid rebuilt from word geometry
+
+OCR_ROUTING chooses between them:
+
+* ``textract`` or ``tesseract``  that backend, falling back to the other when
+  it is unavailable or fails with an outage-type error
+* ``cost``     the cheapest backend that supports the request
+* ``latency``  the cheapest one whose recent latency meets OCR_LATENCY_TARGET
+  seconds, else the fastest
+
+Textract counts as unavailable for OCR_TEXTRACT_COOLDOWN seconds after
+OCR_TEXTRACT_FAILURES consecutive connection, 5xx or throttling failures, so
+during an AWS incident requests go straight to the local engine. Tesseract
+output in which the parser finds no table also falls back, rather than
+answering with an empty summary.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import MULTIPAGE_EXTENSIONS, SYNC_MAX_BYTES, analyze, cached_analysis
+from blocks import BlockGraph
+from concurrency import DeadlineExceeded, is_retryable
+from metrics import record_ocr
+from timesheet import table_cells
+import tesseract_ocr
+
+logger = logging.getLogger(__name__)
+
+# Rough USD per page, for the cost policy.
+TEXTRACT_PAGE_COST = {"": 0.0015, "TABLES": 0.015, "FORMS": 0.05, "QUERIES": 0.015, "SIGNATURES": 0.0035}
+
+
+class NoTable(Exception):
+    """The backend read the image but the parser finds no table in its output."""
+
+
+class OCRBackend:
+    """Interface for OCR engines. ``analyze`` returns a Textract-shaped response dict."""
+
+    name = None
+
+    def __init__(self, expected_latency=1.0):
+        self.latency = expected_latency
+
+    def available(self):
+        return True
+
+    def supports(self, upload, feature_types):
+        return True
+
+    def cost(self, feature_types):
+        return 0.0
+
+    def analyze(self, upload, feature_types):
+        raise NotImplementedError
+
+    def observe(self, seconds):
+        self.latency = 0.8 * self.latency + 0.2 * seconds
+
+    def failed(self, exc):
+        pass
+
+
+class TextractBackend(OCRBackend):
+    name = "textract"
+
+    def __init__(self, expected_latency=2.0, max_failures=3, cooldown=60.0):
+        super().__init__(expected_latency)
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._failures = 0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def supports(self, upload, feature_types):
+        return upload.size <= SYNC_MAX_BYTES
+
+    def cost(self, feature_types):
+        return sum(TEXTRACT_PAGE_COST.get(f, 0.015) for f in feature_types) or TEXTRACT_PAGE_COST[""]
+
+    def analyze(self, upload, feature_types):
+        response = analyze(upload, feature_types)
+        with self._lock:
+            self._failures = 0
+        return response
+
+    def failed(self, exc):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                self._down_until = time.monotonic() + self.cooldown
+                self._failures = 0
+                logger.warning(f"Textract marked unavailable for {self.cooldown:.0f}s after repeated failures")
+
+
+class TesseractBackend(OCRBackend):
+    name = "tesseract"
+
+    def __init__(self, workers=2, timeout=60.0, expected_latency=1.5):
+        super().__init__(expected_latency)
+        self.workers = workers
+        self.timeout = timeout
+        self._available = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # A fork of a threaded web worker can deadlock, so OCR processes come
+        # from a forkserver; each web worker starts its own pool.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("forkserver"))
+                self._pid = os.getpid()
+            return self._executor
+
+    def available(self):
+        if self._available is None:
+            self._available = tesseract_ocr.tesseract_available()
+        return self._available
+
+    def supports(self, upload, feature_types):
+        # No PDF rendering or multi-page TIFFs; tables come from geometry, other features not at all.
+        return (not (upload.filename or '').lower().endswith(MULTIPAGE_EXTENSIONS)
+                and set(feature_types) <= {"TABLES"})
+
+    def analyze(self, upload, feature_types):
+        key = upload.content_key("tesseract", tesseract_ocr.TESSERACT_LANG, tesseract_ocr.TESSERACT_CONFIG,
+                                 tesseract_ocr.TESSERACT_COLUMN_GAP)
+        response = cached_analysis(key, "content", f"{key[:12]} (tesseract)", lambda: self._recognize(upload))
+        if not table_cells(BlockGraph.from_response(response)):
+            raise NoTable(f"Tesseract found no table in {upload.filename}")
+        return response
+
+    def _recognize(self, upload):
+        future = self._pool().submit(tesseract_ocr.recognize, upload.read())
+        return future.result(timeout=self.timeout)
+
+
+def is_outage(exc):
+    """Errors that say the backend is down or overloaded, rather than that the image is bad."""
+    return isinstance(exc, (DeadlineExceeded, TimeoutError)) or is_retryable(exc)
+
+
+def should_fall_back(exc):
+    return is_outage(exc) or isinstance(exc, NoTable)
+
+
+class OCRRouter:
+    POLICIES = ("textract", "tesseract", "cost", "latency")
+
+    def __init__(self, backends, policy="textract", latency_target=3.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown OCR_ROUTING: {policy}")
+        self.backends = {b.name: b for b in backends}
+        self.policy = policy
+        self.latency_target = latency_target
+
+    @classmethod
+    def from_env(cls):
+        backends = [
+            TextractBackend(max_failures=int(os.environ.get("OCR_TEXTRACT_FAILURES", 3)),
+                            cooldown=float(os.environ.get("OCR_TEXTRACT_COOLDOWN", 60))),
+            TesseractBackend(workers=int(os.environ.get("TESSERACT_WORKERS", 2)),
+                             timeout=float(os.environ.get("TESSERACT_TIMEOUT", 60))),
+        ]
+        return cls(backends, os.environ.get("OCR_ROUTING", "textract"),
+                   float(os.environ.get("OCR_LATENCY_TARGET", 3.0)))
+
+    def candidates(self, upload, feature_types):
+        """Usable backends for this upload, best first under the routing policy."""
+        usable = [b for b in self.backends.values() if b.available() and b.supports(upload, feature_types)]
+        if self.policy == "cost":
+            return sorted(usable, key=lambda b: (b.cost(feature_types), b.latency))
+        if self.policy == "latency":
+            fast = [b for b in usable if b.latency <= self.latency_target]
+            slow = [b for b in usable if b.latency > self.latency_target]
+            return (sorted(fast, key=lambda b: b.cost(feature_types))
+                    + sorted(slow, key=lambda b: b.latency))
+        return sorted(usable, key=lambda b: b.name != self.policy)
+
+    def analyze(self, upload, feature_types):
+        candidates = self.candidates(upload, feature_types)
+        if not candidates:
+            # Nothing looks usable; let Textract try and report the real error.
+            candidates = [self.backends["textract"]]
+        for i, backend in enumerate(candidates):
+            start = time.monotonic()
+            try:
+                response = backend.analyze(upload, feature_types)
+            except Exception as e:
+                if not should_fall_back(e):
+                    raise
+                backend.failed(e)
+                if i == len(candidates) - 1:
+                    raise
+                record_ocr(backend.name, "fallback")
+                logger.warning(f"OCR backend {backend.name} failed ({e}), trying {candidates[i + 1].name}")
+                continue
+            backend.observe(time.monotonic() - start)
+            record_ocr(backend.name, "ok")
+            return response
@@ -0,0 +1,148 @@
+"""Client-side token buckets for Textract, shared by every worker on the host.
+
+Textract enforces a transactions-per-second quota per account, region and
+operation. Left alone, a burst across many gunicorn workers overshoots it and
+turns into throttling errors. Each bucket's state (tokens, last refill) lives
+in a small file, on /dev/shm when available, and is updated under an flock,
+so all processes draw from the same budget.
+
+Callers reserve a token even when the bucket is empty and then sleep until it
+is due, which queues them in arrival order; only when the wait would exceed
+``max_wait`` do they give up with RateLimited.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STATE = struct.Struct("dd")
+
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FileTokenBucket:
+    def __init__(self, path, rate, burst=None, max_wait=5.0):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.max_wait = max_wait
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _file(self):
+        # flock is tied to the open file description, which a forked child would
+        # share with its parent, so every process opens its own.
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def reserve(self):
+        """Take a token; return how long the caller must wait before using it."""
+        with self._lock:
+            fd = self._file()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(fd, _STATE.size, 0)
+                if len(data) == _STATE.size:
+                    tokens, updated = _STATE.unpack(data)
+                    tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                else:
+                    tokens = self.burst
+
+                wait = max(0.0, (1 - tokens) / self.rate)
+                if wait > self.max_wait:
+                    raise RateLimited(f"Textract rate limit of {self.rate:g}/s reached, try again later.", wait)
+                os.pwrite(fd, _STATE.pack(tokens - 1, now), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    """Buckets per (account, region, operation), with limits from configuration.
+
+    ``limits`` maps ``"<account>/<region>"`` or ``"<region>"`` to a rate in
+    requests per second; ``default_rate`` applies elsewhere, and a rate of 0
+    means unlimited.
+    """
+
+    def __init__(self, directory, default_rate=0.0, limits=None, burst=None, max_wait=5.0):
+        self.directory = directory
+        self.default_rate = default_rate
+        self.limits = limits or {}
+        self.burst = burst
+        self.max_wait = max_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("TEXTRACT_RATE_DIR") or (
+            "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+        burst = os.environ.get("TEXTRACT_BURST")
+        return cls(
+            directory,
+            default_rate=float(os.environ.get("TEXTRACT_TPS", 0)),
+            limits=json.loads(os.environ.get("TEXTRACT_TPS_LIMITS", "{}")),
+            burst=float(burst) if burst else None,
+            max_wait=float(os.environ.get("TEXTRACT_RATE_MAX_WAIT", 5)),
+        )
+
+    def rate_for(self, account, region):
+        for key in (f"{account}/{region}", region):
+            if key in self.limits:
+                return float(self.limits[key])
+        return self.default_rate
+
+    def bucket(self, account, region, operation):
+        rate = self.rate_for(account, region)
+        if rate <= 0:
+            return None
+        key = (account, region, operation)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"textract-{account}-{region}-{operation}")
+                bucket = FileTokenBucket(os.path.join(self.directory, f"{name}.bucket"),
+                                         rate, self.burst, self.max_wait)
+                self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, account, region, operation):
+        bucket = self.bucket(account, region, operation)
+        if bucket is None:
+            return 0.0
+        waited = bucket.acquire()
+        if waited:
+            logger.info(f"Waited {waited:.2f}s for Textract {operation} rate limit")
+        return waited
+
+
+def current_account():
+    """Account the limits apply to: AWS_ACCOUNT_ID, else a hash of the access key id."""
+    account = os.environ.get("AWS_ACCOUNT_ID")
+    if account:
+        return account
+    key_id = os.environ.get("AWS_ACCESS_KEY_ID", "")
+    return hashlib.sha1(key_id.encode()).hexdigest()[:12]
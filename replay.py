@@ -0,0 +1,137 @@
+"""Record-and-replay of Textract responses.
+
+With TEXTRACT_REPLAY_MODE=record every synchronous Textract response for an
+upload is saved in TEXTRACT_REPLAY_DIR as ``<image sha256>.<features>.json``,
+together with how long the call took. With TEXTRACT_REPLAY_MODE=replay those
+files answer instead of AWS (sleeping for the recorded latency when
+TEXTRACT_REPLAY_LATENCY=1), so production uploads can be pushed through
+/process offline to profile the parser or reproduce a slow request. Set
+TEXTRACT_CACHE_SIZE=0 when replaying, or repeated uploads are answered by the
+response cache instead. fake_textract.py serves the same directory too.
+
+Run as a script to time the parser over every recording, slowest first;
+``--output`` writes each summary so two parser versions can be diffed:
+
+    python replay.py recorded/ --top 20 --output before.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+RECORDING_KEY = "Recording"
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class NotRecorded(LookupError):
+    pass
+
+
+def without_recording(response):
+    return {k: v for k, v in response.items() if k != RECORDING_KEY}
+
+
+class ResponseRecorder:
+    def __init__(self, mode=OFF, directory="recorded", simulate_latency=False):
+        if mode not in (OFF, RECORD, REPLAY):
+            raise ValueError(f"Unknown TEXTRACT_REPLAY_MODE: {mode}")
+        self.mode = mode
+        self.directory = directory
+        self.simulate_latency = simulate_latency
+        if mode == RECORD:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get("TEXTRACT_REPLAY_MODE", OFF),
+            directory=os.environ.get("TEXTRACT_REPLAY_DIR", "recorded"),
+            simulate_latency=os.environ.get("TEXTRACT_REPLAY_LATENCY") == "1",
+        )
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def path(self, digest, features):
+        return os.path.join(self.directory, f"{digest}.{features}.json")
+
+    def save(self, digest, features, response, latency):
+        recorded = {k: v for k, v in response.items() if k != "ResponseMetadata"}
+        recorded[RECORDING_KEY] = {"features": features, "latency": latency, "recorded_at": time.time()}
+        path = self.path(digest, features)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(recorded, fh, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not record Textract response to {path}: {e}")
+
+    def replay(self, digest, features):
+        path = self.path(digest, features)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                recorded = json.load(fh)
+        except FileNotFoundError:
+            raise NotRecorded(f"No recorded Textract response for {digest[:12]} ({features})")
+        latency = recorded.get(RECORDING_KEY, {}).get("latency", 0)
+        if self.simulate_latency and latency:
+            time.sleep(latency)
+        return without_recording(recorded)
+
+
+def profile(directory):
+    """(path, seconds, summary) for every recording, timing only the parser."""
+    from timesheet import summarize
+
+    results = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as fh:
+            response = without_recording(json.load(fh))
+        start = time.perf_counter()
+        summary = summarize(response)
+        results.append((path, time.perf_counter() - start, summary))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the parser over recorded Textract responses")
+    parser.add_argument("directory", nargs="?", default=os.environ.get("TEXTRACT_REPLAY_DIR", "recorded"))
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest to list")
+    parser.add_argument("--output", help="write one JSON summary per recording here")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = profile(args.directory)
+    if not results:
+        print(f"No recordings in {args.directory}", file=sys.stderr)
+        return 1
+
+    total = sum(seconds for _, seconds, _ in results)
+    print(f"{len(results)} recordings, {total * 1000:.1f} ms total, {total / len(results) * 1000:.2f} ms mean")
+    for path, seconds, _ in sorted(results, key=lambda r: -r[1])[:args.top]:
+        print(f"{seconds * 1000:>10.2f} ms  {os.path.basename(path)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            for path, _, summary in results:
+                fh.write(json.dumps({"recording": os.path.basename(path), "summary": summary}, sort_keys=True) + "\n")
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
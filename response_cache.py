@@ -0,0 +1,205 @@
+"""Two-tier cache of raw Textract responses.
+
+Entries live in an in-memory LRU and, when a directory is configured, in
+gzip-compressed JSON files on disk so they survive restarts and are shared by
+every worker on the host. Both tiers are bounded and expire entries by TTL.
+The disk tier is swept for expired and excess entries on a background thread,
+at most every TEXTRACT_CACHE_EVICT_INTERVAL seconds (sooner once this process
+has written a tenth of the size limit), so a cache miss never pays for a walk
+of the whole directory.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data, *parts):
+    """Content address for ``data``, qualified by anything else that shapes the response."""
+    return digest_key(hashlib.sha256(data).hexdigest(), *parts)
+
+
+def digest_key(digest, *parts):
+    """``content_key`` for data whose SHA-256 hex digest is already known."""
+    return ":".join([digest, *(str(p) for p in parts if p)])
+
+
+def strip_metadata(response):
+    return {k: v for k, v in response.items() if k != "ResponseMetadata"}
+
+
+class MemoryTier:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, stored_at=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskTier:
+    def __init__(self, directory, max_bytes, ttl, evict_interval=60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self._next_evict = 0.0
+        self._written = 0
+        self._evicting = None
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, name[:2], name + ".json.gz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if time.time() - stored_at > self.ttl:
+                os.remove(path)
+                return None
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                return stored_at, json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+            json.dump(value, fh, default=str)
+        self._written += os.path.getsize(tmp)
+        os.replace(tmp, path)
+        if time.monotonic() >= self._next_evict or self._written > self.max_bytes // 10:
+            self._schedule_evict()
+
+    def _schedule_evict(self):
+        # A lock held by a sweep in the parent would stay held in a forked child.
+        if self._pid != os.getpid():
+            self._evicting = threading.Lock()
+            self._pid = os.getpid()
+        if not self._evicting.acquire(blocking=False):
+            return
+        self._next_evict = time.monotonic() + self.evict_interval
+        self._written = 0
+        threading.Thread(target=self._evict_in_background, name="cache-evict", daemon=True).start()
+
+    def _evict_in_background(self):
+        try:
+            self._evict()
+        except Exception as e:
+            logger.warning(f"Cache eviction in {self.directory} failed: {e}")
+        finally:
+            self._evicting.release()
+
+    def _evict(self):
+        files = []
+        total = 0
+        now = time.time()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if now - st.st_mtime > self.ttl:
+                    self._remove(path)
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        while total > self.max_bytes and files:
+            _, size, path = files.pop(0)
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ResponseCache:
+    def __init__(self, max_entries=128, ttl=86400, directory=None, max_disk_bytes=512 * 1024 * 1024,
+                 evict_interval=60.0):
+        self.memory = MemoryTier(max_entries, ttl)
+        self.disk = DiskTier(directory, max_disk_bytes, ttl, evict_interval) if directory else None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("TEXTRACT_CACHE_SIZE", 128)),
+            ttl=float(os.environ.get("TEXTRACT_CACHE_TTL", 86400)),
+            directory=os.environ.get("TEXTRACT_CACHE_DIR") or None,
+            max_disk_bytes=int(os.environ.get("TEXTRACT_CACHE_DISK_BYTES", 512 * 1024 * 1024)),
+            evict_interval=float(os.environ.get("TEXTRACT_CACHE_EVICT_INTERVAL", 60)),
+        )
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            found = self.disk.get(key)
+            if found is not None:
+                stored_at, value = found
+                self.memory.put(key, value, stored_at)
+                return value
+        return None
+
+    def put(self, key, response):
+        value = strip_metadata(response)
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry to disk: {e}")
+
+    def clear(self):
+        self.memory.clear()
@@ -0,0 +1,79 @@
+"""Coalescing of identical concurrent Textract analyses.
+
+A double-submitted form, or two managers uploading the same sheet at once,
+would otherwise pay for the same analysis twice. ``SingleFlight.do`` lets the
+first caller for a key run the work while later callers in the same process
+wait for it and share its result.
+
+Across gunicorn workers the leader also holds an flock on a lock file picked
+by the key, so a worker that arrives while another is mid-analysis blocks
+until it finishes. What it then finds depends on the work function: with the
+shared disk cache it re-checks the cache before calling Textract, so the
+first worker's answer is reused. Lock files are a fixed set of stripes, so
+unrelated keys can occasionally wait on each other but no files pile up.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, stripes=256):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self._calls = {}
+        self._lock = threading.Lock()
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def _lock_path(self, key):
+        stripe = int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) % self.stripes
+        return os.path.join(self.lock_dir, f"{stripe:03d}.lock")
+
+    def _run(self, key, fn):
+        if not self.lock_dir:
+            return fn()
+        # A fresh open file description per flight, so threads and forked
+        # workers never share (and silently re-enter) the same flock.
+        fd = os.open(self._lock_path(key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            return fn()
+        finally:
+            os.close(fd)
+
+    def do(self, key, fn):
+        """Run ``fn`` once for concurrent callers with the same key; return (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
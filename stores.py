@@ -0,0 +1,48 @@
+"""Pieces shared by the job, idempotency-key and response-archive stores.
+
+Store interfaces take JSON-serialisable results, so every backend can hold
+them. Memory backends live in one process; SQLite backends are files shared
+by every gunicorn worker.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+
+
+class MemoryStore:
+    """Per-process store; only suitable for a single worker or tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+
+class SQLiteStore:
+    """Store in a SQLite database file, created with ``schema`` on first use."""
+
+    def __init__(self, db_path, schema=()):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in schema:
+                conn.execute(statement)
+
+    def _connect(self):
+        # sqlite3 connections cannot cross threads or forks; keep one per thread and pid.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+def store_from_env(prefix, memory_store, sqlite_store, filename):
+    """The store chosen by ``<prefix>_STORE`` (sqlite or memory), at ``<prefix>_DB_PATH`` for SQLite."""
+    kind = os.environ.get(f"{prefix}_STORE", "sqlite")
+    if kind == "memory":
+        return memory_store()
+    if kind == "sqlite":
+        return sqlite_store(os.environ.get(f"{prefix}_DB_PATH", os.path.join(tempfile.gettempdir(), filename)))
+    raise ValueError(f"Unknown {prefix}_STORE: {kind}")
@@ -0,0 +1,131 @@
+"""Synthetic Textract responses for load tests and benchmarks.
+
+``generate_response`` lays out a timesheet the way AnalyzeDocument reports it:
+a dated title line, then a table whose first column holds names and whose
+other cells hold IN/OUT time pairs, with WORD, LINE, CELL, TABLE and PAGE
+blocks and bounding boxes. Noise tokens and the OCR misreads the parser has to
+undo (``!`` or ``l`` for 1, ``O`` for 0, ``%`` or ``.`` for the colon, glued
+``IN07:00``) can be mixed in at chosen rates.
+"""
+import random
+import uuid
+
+MISREADS = {
+    "1": ("!", "I", "l", "|"),
+    "0": ("O", "o"),
+    ":": ("%", ";", ",", "."),
+}
+NOISE = ("~", "-", "_", "'", "*", "=")
+QUARTERS = ("00", "15", "30", "45")
+
+
+def blocks_per_cell(words_per_cell):
+    """Blocks each table cell contributes: the CELL, its LINE and its WORDs."""
+    return words_per_cell + 2
+
+
+def rows_for_blocks(n_blocks, cols=8, words_per_cell=4):
+    """Row count giving roughly ``n_blocks`` blocks for the given table shape."""
+    return max(1, round(n_blocks / (cols * blocks_per_cell(words_per_cell))))
+
+
+class _Builder:
+    def __init__(self, seed, row_height):
+        self.rnd = random.Random(seed)
+        self.row_height = row_height
+        self.blocks = []
+
+    def new_id(self):
+        return str(uuid.UUID(int=self.rnd.getrandbits(128)))
+
+    def line(self, words, left, top, width):
+        """Append WORD blocks and their LINE; return the word ids."""
+        text = " ".join(words)
+        unit = width / max(len(text), 1)
+        height = self.row_height / 2
+        word_ids = []
+        x = left
+        for word in words:
+            word_id = self.new_id()
+            w = unit * len(word)
+            self.blocks.append({"BlockType": "WORD", "Id": word_id, "Text": word, "TextType": "HANDWRITING",
+                                "Confidence": round(self.rnd.uniform(80, 99.9), 2),
+                                "Geometry": {"BoundingBox": {"Left": x, "Top": top, "Width": w, "Height": height}}})
+            word_ids.append(word_id)
+            x += w + unit
+        self.blocks.append({"BlockType": "LINE", "Id": self.new_id(), "Text": text,
+                            "Confidence": 99.0,
+                            "Geometry": {"BoundingBox": {"Left": left, "Top": top, "Width": width, "Height": height}},
+                            "Relationships": [{"Type": "CHILD", "Ids": word_ids}]})
+        return word_ids
+
+
+def _misread(text, rate, rnd):
+    if not rate:
+        return text
+    return "".join(rnd.choice(MISREADS[ch]) if ch in MISREADS and rnd.random() < rate else ch for ch in text)
+
+
+def _entry_words(words_per_cell, noise_rate, misread_rate, rnd):
+    """IN/OUT pairs filling ``words_per_cell`` words, with noise and misreads."""
+    words = []
+    hour = rnd.randint(6, 9)
+    for _ in range(max(1, words_per_cell // 4)):
+        start = f"{hour:02d}:{rnd.choice(QUARTERS)}"
+        hour = min(hour + rnd.randint(2, 5), 23)
+        end = f"{hour:02d}:{rnd.choice(QUARTERS)}"
+        hour = min(hour + 1, 23)
+        start, end = _misread(start, misread_rate, rnd), _misread(end, misread_rate, rnd)
+        if rnd.random() < misread_rate:
+            words += [f"IN{start}", f"{end}OUT"]
+        else:
+            words += ["IN", start, "OUT", end]
+    while len(words) < words_per_cell:
+        words.append(rnd.choice(NOISE))
+    if noise_rate:
+        for _ in range(len(words)):
+            if rnd.random() < noise_rate:
+                words.insert(rnd.randrange(len(words) + 1), rnd.choice(NOISE))
+    return words
+
+
+def generate_response(rows=12, cols=8, words_per_cell=4, noise_rate=0.0, misread_rate=0.0,
+                      seed=0, with_tables=True):
+    """A synthetic AnalyzeDocument response (DetectDocumentText when ``with_tables`` is False).
+
+    ``rows`` includes the header row; ``words_per_cell`` is rounded to whole
+    IN/OUT pairs with noise tokens making up the rest.
+    """
+    b = _Builder(seed, row_height=min(0.04, 0.8 / (rows + 1)))
+    rnd = b.rnd
+    col_width = 0.9 / cols
+    month = rnd.randint(1, 12)
+
+    b.line(["W/E", f"{rnd.randint(1, 28):02d}/{month:02d}/{rnd.randint(20, 29)}"], 0.05, 0.02, 0.15)
+
+    cells = []
+    for r in range(1, rows + 1):
+        top = 0.1 + (r - 1) * b.row_height
+        for c in range(1, cols + 1):
+            if r == 1:
+                words = ["DATE"] if c == 1 else [f"{c - 1:02d}/{month:02d}"]
+            elif c == 1:
+                words = [f"EMPLOYEE{r - 1}"]
+            else:
+                words = _entry_words(words_per_cell, noise_rate, misread_rate, rnd)
+            left = 0.05 + (c - 1) * col_width
+            word_ids = b.line(words, left + col_width * 0.05, top + b.row_height / 4, col_width * 0.8)
+            cells.append({"BlockType": "CELL", "Id": b.new_id(), "Confidence": 90.0,
+                          "RowIndex": r, "ColumnIndex": c, "RowSpan": 1, "ColumnSpan": 1,
+                          "Geometry": {"BoundingBox": {"Left": left, "Top": top,
+                                                       "Width": col_width, "Height": b.row_height}},
+                          "Relationships": [{"Type": "CHILD", "Ids": word_ids}]})
+
+    blocks = b.blocks
+    if with_tables:
+        blocks.append({"BlockType": "TABLE", "Id": b.new_id(),
+                       "Relationships": [{"Type": "CHILD", "Ids": [cell["Id"] for cell in cells]}]})
+        blocks.extend(cells)
+    page = {"BlockType": "PAGE", "Id": b.new_id(),
+            "Relationships": [{"Type": "CHILD", "Ids": [x["Id"] for x in blocks if x["BlockType"] == "LINE"]}]}
+    return {"DocumentMetadata": {"Pages": 1}, "Blocks": [page] + blocks}
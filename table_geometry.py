@@ -0,0 +1,167 @@
+"""Rebuilds a table grid from DetectDocumentText output using word geometry.
+
+Plain text detection is cheaper and faster than TABLES analysis, but returns no
+CELL blocks. For fixed-layout timesheets the grid can be recovered from the
+bounding boxes alone:
+
+* rows are clusters of text lines with close vertical centres,
+* columns are separated by horizontal gutters that (almost) no line crosses,
+* each line is placed in a column by bisecting its centre against the gutter
+  positions, so assignment is O(log columns) per line instead of comparing
+  every line with every cell.
+
+The result has the same ``{row: {col: text}}`` shape as ``BlockGraph.cells()``.
+"""
+from bisect import bisect_right
+
+BINS = 1000
+
+
+class _Segment:
+    __slots__ = ("top", "bottom", "left", "right", "text")
+
+    def __init__(self, box, text):
+        self.top = box["Top"]
+        self.bottom = box["Top"] + box["Height"]
+        self.left = box["Left"]
+        self.right = box["Left"] + box["Width"]
+        self.text = text
+
+    @property
+    def cy(self):
+        return (self.top + self.bottom) / 2
+
+    @property
+    def cx(self):
+        return (self.left + self.right) / 2
+
+
+def _segments(graph):
+    """LINE blocks with their word text; bare WORDs when there are no LINEs."""
+    segments = []
+    lines = graph.of_type("LINE")
+    if lines:
+        for line in lines:
+            box = line.get("Geometry", {}).get("BoundingBox")
+            text = graph.text(line) or line.get("Text", '')
+            if box and text:
+                segments.append(_Segment(box, text))
+    else:
+        for word in graph.of_type("WORD"):
+            box = word.get("Geometry", {}).get("BoundingBox")
+            if box and word.get("Text"):
+                segments.append(_Segment(box, word["Text"]))
+    return segments
+
+
+def _cluster_rows(segments):
+    """Group segments whose vertical centres are within half a line height."""
+    heights = sorted(s.bottom - s.top for s in segments)
+    tolerance = heights[len(heights) // 2] * 0.5
+
+    rows = []
+    current = []
+    cy_sum = 0.0
+    for seg in sorted(segments, key=lambda s: s.cy):
+        if current and seg.cy - cy_sum / len(current) > tolerance:
+            rows.append(current)
+            current = []
+            cy_sum = 0.0
+        current.append(seg)
+        cy_sum += seg.cy
+    if current:
+        rows.append(current)
+    return rows
+
+
+def _bin(x):
+    # Textract coordinates are page ratios but can stray slightly outside [0, 1].
+    return min(max(int(x * BINS), 0), BINS)
+
+
+def _column_boundaries(rows, gutter_fraction):
+    """x positions separating columns, from bins that few rows cover."""
+    coverage = [0] * (BINS + 2)
+    for row in rows:
+        # Merge each row's intervals first so a row counts once per bin.
+        spans = sorted((_bin(s.left), _bin(s.right)) for s in row)
+        start, end = spans[0]
+        merged = []
+        for a, b in spans[1:]:
+            if a <= end:
+                end = max(end, b)
+            else:
+                merged.append((start, end))
+                start, end = a, b
+        merged.append((start, end))
+        for a, b in merged:
+            coverage[a] += 1
+            coverage[b + 1] -= 1
+
+    threshold = max(1, gutter_fraction * len(rows))
+    boundaries = []
+    running = 0
+    gutter_start = None
+    seen_column = False
+    for b in range(BINS + 1):
+        running += coverage[b]
+        if running > threshold:
+            if gutter_start is not None and seen_column:
+                boundaries.append((gutter_start + b) / 2 / BINS)
+            gutter_start = None
+            seen_column = True
+        elif gutter_start is None:
+            gutter_start = b
+    return boundaries
+
+
+def detect_boundaries(graph, gutter_fraction=0.05):
+    """Column edges found from the gutters in a text-detection response."""
+    segments = _segments(graph)
+    if not segments:
+        return []
+    return _column_boundaries(_cluster_rows(segments), gutter_fraction)
+
+
+def reconstruct_cells(graph, gutter_fraction=0.05, boundaries=None):
+    """``{row: {col: text}}`` for the table in a text-detection response.
+
+    ``boundaries`` skips gutter detection and uses known column edges instead,
+    e.g. from a learned layout template.
+    """
+    segments = _segments(graph)
+    if not segments:
+        return {}
+
+    rows = _cluster_rows(segments)
+    if boundaries is None:
+        boundaries = _column_boundaries(rows, gutter_fraction)
+    n_cols = len(boundaries) + 1
+
+    grid = []
+    for row in rows:
+        cols = {}
+        for seg in sorted(row, key=lambda s: s.left):
+            c = bisect_right(boundaries, seg.cx) + 1
+            cols[c] = f"{cols[c]} {seg.text}" if c in cols else seg.text
+        grid.append(cols)
+
+    # The table spans the rows that fill more than one column; lines above or
+    # below it (titles, signatures) are not part of the grid.
+    in_table = [i for i, cols in enumerate(grid) if len(cols) > 1]
+    if not in_table:
+        return {}
+
+    cells = {}
+    r = 0
+    for cols in grid[in_table[0]:in_table[-1] + 1]:
+        if r and 1 not in cols:
+            # A row without a first-column entry continues the one above it,
+            # e.g. an OUT time wrapped onto a second line of the cell.
+            prev = cells[r]
+            for c, text in cols.items():
+                prev[c] = f"{prev[c]} {text}".strip()
+            continue
+        r += 1
+        cells[r] = {c: cols.get(c, '') for c in range(1, n_cols + 1)}
+    return cells
@@ -0,0 +1,252 @@
+"""Learned layout templates for recurring printed timesheets.
+
+The first time a layout is seen it is analysed with TABLES, and the column
+edges, header height and name column are recorded under a fingerprint of the
+printed header text. Later sheets run only the cheaper DetectDocumentText; a
+template is used only when the gutters found on the page line up with its
+column edges and the page's header text is close enough to its own (Jaccard
+similarity of at least LAYOUT_TEMPLATE_MIN_SCORE), in which case the table is
+rebuilt from the stored column edges. Anything else goes to TABLES analysis,
+since a wrong match silently produces wrong hours. Templates are kept in a
+JSON file shared by every worker and reloaded whenever another process changes
+it.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import logging
+from statistics import median
+
+from analysis import analyze
+from blocks import BlockGraph
+from table_geometry import detect_boundaries, reconstruct_cells
+from timesheet import row_name, summarize
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_token(text):
+    """Printed label form of a word: upper case, digits collapsed to '#'."""
+    return re.sub(r"\d", "#", text.strip().upper())
+
+
+def _box(block):
+    return block.get("Geometry", {}).get("BoundingBox")
+
+
+def header_tokens(graph, header_bottom):
+    """Normalised words whose vertical centre is above ``header_bottom``."""
+    tokens = set()
+    for word in graph.of_type("WORD"):
+        box = _box(word)
+        if box and box["Top"] + box["Height"] / 2 < header_bottom and word.get("Text", '').strip():
+            tokens.add(normalize_token(word["Text"]))
+    return tokens
+
+
+class Template:
+    def __init__(self, fingerprint, tokens, boundaries, name_column=1, header_bottom=0.0, learned_at=None):
+        self.fingerprint = fingerprint
+        self.tokens = set(tokens)
+        self.boundaries = list(boundaries)
+        self.name_column = name_column
+        self.header_bottom = header_bottom
+        self.learned_at = learned_at or time.time()
+
+    def to_dict(self):
+        return {
+            "tokens": sorted(self.tokens),
+            "boundaries": self.boundaries,
+            "name_column": self.name_column,
+            "header_bottom": self.header_bottom,
+            "learned_at": self.learned_at,
+        }
+
+    @classmethod
+    def from_dict(cls, fingerprint, data):
+        return cls(fingerprint, **data)
+
+    def score(self, tokens):
+        """Jaccard similarity of this template's header tokens and ``tokens``."""
+        union = self.tokens | tokens
+        return len(self.tokens & tokens) / len(union) if union else 0.0
+
+    def fits(self, boundaries):
+        """Whether column edges detected on a page line up with the learned ones."""
+        if len(boundaries) != len(self.boundaries):
+            return False
+        edges = [0.0] + self.boundaries + [1.0]
+        for i, (found, learned) in enumerate(zip(boundaries, self.boundaries)):
+            # A text gutter sits somewhere in the gap between two columns'
+            # words rather than on the cell border (far from it when text is
+            # left-aligned), so only require each gutter to be nearer its own
+            # learned edge than either neighbour.
+            width = min(edges[i + 1] - edges[i], edges[i + 2] - edges[i + 1])
+            if abs(found - learned) >= width / 2:
+                return False
+        return True
+
+    def cells(self, graph):
+        """Cells for a text-detection response laid out like this template."""
+        cells = reconstruct_cells(graph, boundaries=self.boundaries)
+        if self.name_column == 1:
+            return cells
+        # The parser expects names in column 1; move the learned name column there.
+        order = [self.name_column] + [c for c in range(1, len(self.boundaries) + 2) if c != self.name_column]
+        return {r: {i: cols.get(c, '') for i, c in enumerate(order, start=1)} for r, cols in cells.items()}
+
+    @classmethod
+    def learn(cls, graph, min_tokens=4):
+        """Template from a TABLES analysis, or None when the layout has no usable header."""
+        by_col = {}
+        rows = {}
+        for cell in graph.of_type("CELL"):
+            box = _box(cell)
+            if not box:
+                continue
+            by_col.setdefault(cell["ColumnIndex"], []).append(box)
+            rows.setdefault(cell["RowIndex"], {})[cell["ColumnIndex"]] = (graph.text(cell), box)
+        if len(by_col) < 2:
+            return None
+
+        n_cols = max(by_col)
+        lefts = {c: median(b["Left"] for b in boxes) for c, boxes in by_col.items()}
+        rights = {c: median(b["Left"] + b["Width"] for b in boxes) for c, boxes in by_col.items()}
+        boundaries = []
+        for c in range(1, n_cols):
+            if c not in rights or c + 1 not in lefts:
+                return None
+            boundaries.append((rights[c] + lefts[c + 1]) / 2)
+
+        # Leading rows without an employee name are the printed header.
+        header_rows = 0
+        header_bottom = 0.0
+        for r in sorted(rows):
+            cols = {c: text for c, (text, _) in rows[r].items()}
+            if row_name(cols) is not None:
+                break
+            header_rows += 1
+            header_bottom = max(header_bottom, *(b["Top"] + b["Height"] for _, b in rows[r].values()))
+        if not header_rows:
+            return None
+
+        # The name column is the one whose body cells are mostly letters.
+        def name_like(c):
+            texts = [rows[r][c][0] for r in sorted(rows)[header_rows:] if c in rows[r]]
+            return sum(1 for t in texts if t and re.search(r"[A-Za-z]", t) and not re.search(r"\d", t))
+        name_column = max(range(1, n_cols + 1), key=lambda c: (name_like(c), -c))
+
+        # Digits collapse to '#', so dates and times alone say little about a layout.
+        tokens = header_tokens(graph, header_bottom)
+        if len(tokens) < min_tokens:
+            return None
+
+        fingerprint = hashlib.sha1("\n".join(sorted(tokens)).encode()).hexdigest()[:16]
+        return cls(fingerprint, tokens, boundaries, name_column, header_bottom)
+
+
+class TemplateRegistry:
+    """Templates persisted to a JSON file and shared between worker processes."""
+
+    def __init__(self, path, min_score=0.8, min_tokens=4):
+        self.path = path
+        self.min_score = min_score
+        self.min_tokens = min_tokens
+        self._templates = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get("LAYOUT_TEMPLATE_PATH", os.path.join(tempfile.gettempdir(), "textract-templates.json")),
+            min_score=float(os.environ.get("LAYOUT_TEMPLATE_MIN_SCORE", 0.8)),
+            min_tokens=int(os.environ.get("LAYOUT_TEMPLATE_MIN_TOKENS", 4)),
+        )
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable template file {self.path}: {e}")
+            return {}
+        return {fp: Template.from_dict(fp, t) for fp, t in data.items()}
+
+    def reload(self):
+        """Pick up templates written by other workers since the last load."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._templates = self._read()
+                self._mtime = mtime
+
+    def templates(self):
+        self.reload()
+        return list(self._templates.values())
+
+    def match(self, graph):
+        boundaries = detect_boundaries(graph)
+        best, best_score = None, 0.0
+        for template in self.templates():
+            if not template.fits(boundaries):
+                continue
+            score = template.score(header_tokens(graph, template.header_bottom))
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score >= self.min_score:
+            return best
+        return None
+
+    def add(self, template):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            # Merge with what other workers wrote while holding an exclusive lock.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            templates = self._read()
+            templates[template.fingerprint] = template
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({fp: t.to_dict() for fp, t in templates.items()}, fh)
+            os.replace(tmp, self.path)
+        with self._lock:
+            self._templates = templates
+            self._mtime = os.path.getmtime(self.path)
+        logger.info(f"Learned layout template {template.fingerprint} with {len(template.boundaries) + 1} columns")
+
+    def learn(self, graph):
+        template = Template.learn(graph, self.min_tokens)
+        if template is not None:
+            self.add(template)
+        return template
+
+
+def summarize_with_templates(upload, registry, feature_types, run_ocr=analyze):
+    """Summary from text detection when the layout is known, learning it from a full analysis otherwise.
+
+    ``run_ocr(upload, feature_types)`` does both analyses; pass an OCRRouter's
+    ``analyze`` so routing and fallback apply here too. Returns (summary,
+    template, response): the matched template and the text-detection
+    response, or None and the full analysis that was parsed instead.
+    """
+    text_response = run_ocr(upload, [])
+    graph = BlockGraph.from_response(text_response)
+
+    template = registry.match(graph)
+    if template is not None:
+        logger.info(f"Parsing with layout template {template.fingerprint}")
+        return summarize(text_response, template.cells(graph)), template, text_response
+
+    response = run_ocr(upload, feature_types)
+    registry.learn(BlockGraph.from_response(response))
+    return summarize(response), None, response
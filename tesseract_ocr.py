@@ -0,0 +1,104 @@
+"""Local OCR with Tesseract, producing Textract-shaped blocks.
+
+Runs in the OCR process pool (see ocr_backends.py), so it imports nothing from
+the web app. Words come from ``pytesseract.image_to_data`` and are grouped into
+LINE blocks by Tesseract's block/paragraph/line numbers, with bounding boxes
+normalised to the page like Textract's. There are no CELL blocks; the
+timesheet parser rebuilds the grid from geometry (table_geometry.py), as it
+does for DetectDocumentText. With ``--psm 6`` Tesseract reads a table row as
+one line, so lines are cut wherever two words are further apart than
+TESSERACT_COLUMN_GAP word heights; otherwise every LINE would span the whole
+row and hide the column gutters.
+
+Needs ``pip install pytesseract Pillow`` and the ``tesseract`` binary.
+"""
+import io
+import os
+import shutil
+import uuid
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:  # optional: the Tesseract backend reports itself unavailable
+    pytesseract = None
+    Image = None
+
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD", "tesseract")
+TESSERACT_LANG = os.environ.get("TESSERACT_LANG", "eng")
+TESSERACT_CONFIG = os.environ.get("TESSERACT_CONFIG", "--psm 6")
+TESSERACT_COLUMN_GAP = float(os.environ.get("TESSERACT_COLUMN_GAP", 1.0))
+
+
+def tesseract_available():
+    return pytesseract is not None and shutil.which(TESSERACT_CMD) is not None
+
+
+def _block(block_type, text, confidence, box, **extra):
+    block = {"BlockType": block_type, "Id": str(uuid.uuid4()), "Confidence": confidence,
+             "Geometry": {"BoundingBox": box}}
+    if text is not None:
+        block["Text"] = text
+    block.update(extra)
+    return block
+
+
+def _union(boxes):
+    left = min(b["Left"] for b in boxes)
+    top = min(b["Top"] for b in boxes)
+    right = max(b["Left"] + b["Width"] for b in boxes)
+    bottom = max(b["Top"] + b["Height"] for b in boxes)
+    return {"Left": left, "Top": top, "Width": right - left, "Height": bottom - top}
+
+
+def _split_at_gaps(words, column_gap):
+    """Words of one Tesseract line, cut into runs wherever a gap is wider than ``column_gap`` word heights."""
+    words = sorted(words, key=lambda w: w["Geometry"]["BoundingBox"]["Left"])
+    heights = sorted(w["Geometry"]["BoundingBox"]["Height"] for w in words)
+    limit = heights[len(heights) // 2] * column_gap
+    runs = [[words[0]]]
+    for prev, word in zip(words, words[1:]):
+        prev_box, box = prev["Geometry"]["BoundingBox"], word["Geometry"]["BoundingBox"]
+        if box["Left"] - (prev_box["Left"] + prev_box["Width"]) > limit:
+            runs.append([])
+        runs[-1].append(word)
+    return runs
+
+
+def recognize(image_bytes, lang=TESSERACT_LANG, config=TESSERACT_CONFIG):
+    """A DetectDocumentText-style response for a single-page image."""
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    return response_from_data(data, width, height)
+
+
+def response_from_data(data, width, height, column_gap=TESSERACT_COLUMN_GAP):
+    """The response for ``image_to_data`` output of a ``width`` x ``height`` image."""
+    lines = {}
+    for i, text in enumerate(data["text"]):
+        text = text.strip()
+        confidence = float(data["conf"][i])
+        if not text or confidence < 0:
+            continue
+        box = {"Left": data["left"][i] / width, "Top": data["top"][i] / height,
+               "Width": data["width"][i] / width, "Height": data["height"][i] / height}
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(_block("WORD", text, confidence, box, TextType="PRINTED"))
+
+    blocks = []
+    line_ids = []
+    for key in sorted(lines):
+        for words in _split_at_gaps(lines[key], column_gap):
+            line = _block("LINE", " ".join(w["Text"] for w in words),
+                          sum(w["Confidence"] for w in words) / len(words),
+                          _union([w["Geometry"]["BoundingBox"] for w in words]),
+                          Relationships=[{"Type": "CHILD", "Ids": [w["Id"] for w in words]}])
+            blocks.append(line)
+            blocks.extend(words)
+            line_ids.append(line["Id"])
+
+    page = _block("PAGE", None, 100.0, {"Left": 0.0, "Top": 0.0, "Width": 1.0, "Height": 1.0},
+                  Relationships=[{"Type": "CHILD", "Ids": line_ids}])
+    return {"DocumentMetadata": {"Pages": 1}, "Blocks": [page] + blocks}
@@ -0,0 +1,75 @@
+"""Single-pass scanner for the IN/OUT times in a timesheet cell.
+
+Equivalent to ``timesheet.reference_entry_seconds`` (split ``IN07:00`` and
+``17:30OUT``, fix OCR misreads with ``correct_time_format``, keep tokens that
+come out as ``H:MM``) for ASCII text, without a regex or a chain of
+``str.replace`` calls per token: the misread fixes and the digit extraction
+are one ``str.translate``, the marker split is a ``str.find`` scan, and the
+result for each whitespace-separated word is memoised, since a sheet repeats
+the same few hundred times and markers over and over.
+"""
+import string
+
+# Misread characters become the digits correct_time_format maps them to;
+# every other non-digit is dropped. Separators only matter once fewer than
+# three digits are left, and such a token is never a time anyway.
+_DIGITS = str.maketrans(
+    {**{chr(c): None for c in range(128) if chr(c) not in string.digits},
+     "!": "1", "I": "1", "l": "1", "|": "1", "O": "0", "o": "0"}
+)
+
+# Marks a token that looks like a time but is not one (hour > 23 or minute > 59),
+# which still takes its place in the IN/OUT pairing.
+INVALID = -1
+
+_MAX_CACHED = 65536
+_cache = {}
+
+
+def _split_markers(word):
+    """``word`` cut before a digit that follows IN and before an OUT that follows a digit."""
+    cuts = []
+    i = word.find("IN")
+    while i != -1:
+        if i + 2 < len(word) and word[i + 2] in string.digits:
+            cuts.append(i + 2)
+        i = word.find("IN", i + 2)
+    i = word.find("OUT", 1)
+    while i != -1:
+        if word[i - 1] in string.digits:
+            cuts.append(i)
+        i = word.find("OUT", i + 3)
+    if not cuts:
+        return (word,)
+    cuts.sort()
+    return tuple(word[a:b] for a, b in zip([0] + cuts, cuts + [len(word)]))
+
+
+def _minutes(token):
+    """Minutes past midnight of a time token, INVALID, or None if it is not a time."""
+    digits = token.translate(_DIGITS)
+    if len(digits) >= 4:
+        hours, minutes = int(digits[:2]), int(digits[2:4])
+    elif len(digits) == 3:
+        hours, minutes = int(digits[0]), int(digits[1:3])
+    else:
+        return None
+    return hours * 60 + minutes if hours <= 23 and minutes <= 59 else INVALID
+
+
+def _word_times(word):
+    times = _cache.get(word)
+    if times is None:
+        times = tuple(m for m in map(_minutes, _split_markers(word)) if m is not None)
+        if len(_cache) >= _MAX_CACHED:
+            _cache.clear()
+        _cache[word] = times
+    return times
+
+
+def entry_times(entry):
+    """Times in an ASCII cell, in order, as minutes past midnight or INVALID."""
+    times = []
+    for word in entry.split():
+        times.extend(_word_times(word))
+    return times
@@ -0,0 +1,211 @@
+"""Turns Textract blocks into the timesheet summary returned by the API."""
+from datetime import datetime, timedelta
+import re
+
+from blocks import BlockGraph
+from table_geometry import reconstruct_cells
+from time_tokens import INVALID, entry_times
+from timing import stage
+
+# Bump whenever a parsing change alters summaries; `python archive.py reparse`
+# then recomputes stored documents under the new version.
+PARSER_VERSION = "1"
+
+MONTHS = ["January", "February", "March", "April", "May", "June",
+          "July", "August", "September", "October", "November", "December"]
+
+
+def detect_month(blocks):
+    """"Month YYYY" from the first dd/mm/yy date found in the blocks, else None."""
+    for block in blocks:
+        text = block.get("Text", "")
+        if not text:
+            continue
+        match = re.search(r"(\d{1,2})\s*/\s*(\d{1,2})\s*/\s*(\d{2})", text)
+        if match:
+            day, month_num, year_suffix = match.groups()
+            mi = int(month_num)
+            if 1 <= mi <= 12:
+                return f"{MONTHS[mi-1]} 20{year_suffix}"
+    return None
+
+
+def correct_time_format(text):
+    subs = {
+        '!': '1', 'I': '1', 'l': '1', '|': '1',
+        'O': '0', 'o': '0',
+        '%': ':', ';': ':', ',': ':', '.': ':'
+    }
+    for wrong, right in subs.items():
+        text = text.replace(wrong, right)
+    digits = re.sub(r"\D", "", text)
+    if len(digits) >= 4:
+        return f"{digits[:2]}:{digits[2:4]}"
+    if len(digits) == 3:
+        return f"0{digits[0]}:{digits[1:3]}"
+    return text
+
+
+def row_name(cols):
+    """Employee name from the first column, or None for header and blank rows."""
+    name_raw = cols.get(1, '').strip()
+    name = re.sub(r'\bIN\b', '', name_raw).strip()
+    if not name or name.upper() in ("DATE", "DAY", "IN", "OUT"):
+        return None
+    return name
+
+
+def entry_seconds(entry):
+    """Seconds worked in one cell of IN/OUT time pairs."""
+    if not entry.isascii():
+        return reference_entry_seconds(entry)
+    times = entry_times(entry)
+    day_seconds = 0
+    for i in range(0, len(times)-1, 2):
+        start, end = times[i], times[i+1]
+        if start == INVALID or end == INVALID:
+            continue
+        if end <= start:
+            end += 12 * 60
+        day_seconds += float((end - start) * 60)
+    return day_seconds
+
+
+def reference_entry_seconds(entry):
+    """The regex implementation of ``entry_seconds``, still used for non-ASCII cells."""
+    entry = re.sub(r'IN(?=\d)', 'IN ', entry)
+    entry = re.sub(r'(?<=\d)OUT', ' OUT', entry)
+    parts = re.split(r'\s+', entry)
+    times = []
+    for part in parts:
+        part = correct_time_format(part)
+        if re.match(r"^\d{1,2}:\d{2}$", part):
+            times.append(part)
+
+    day_seconds = 0
+    for i in range(0, len(times)-1, 2):
+        try:
+            start = datetime.strptime(times[i], "%H:%M")
+            end = datetime.strptime(times[i+1], "%H:%M")
+            if end <= start:
+                end += timedelta(hours=12)
+            diff = (end - start).total_seconds()
+            day_seconds += diff
+        except ValueError:
+            continue
+    return day_seconds
+
+
+def row_seconds(cols):
+    """Per-column seconds for one table row, skipping the name column."""
+    return {c: entry_seconds(cols[c]) for c in sorted(cols.keys()) if c != 1}
+
+
+def quarter_hours(seconds):
+    return round((seconds / 3600) * 4) / 4
+
+
+def seconds_by_name(cells):
+    """``{name: {col: seconds}}`` for every employee row in ``cells``."""
+    seconds = {}
+    for row_idx, cols in cells.items():
+        name = row_name(cols)
+        if name is None:
+            continue
+        seconds[name] = row_seconds(cols)
+    return seconds
+
+
+def hours_from_seconds(seconds):
+    weekly_totals = {}
+    daily_hours = {}
+
+    for name, daily_seconds in seconds.items():
+        total_seconds = sum(daily_seconds.values())
+
+        weekly_totals[name] = quarter_hours(total_seconds)
+        daily_hours[name] = {day: quarter_hours(sec) for day, sec in daily_seconds.items()}
+
+    return weekly_totals, daily_hours
+
+
+def hours_by_name(cells):
+    return hours_from_seconds(seconds_by_name(cells))
+
+
+def build_summary(month_year, weekly_totals, daily_hours):
+    max_hours = max(weekly_totals.values()) if weekly_totals else 0
+    top_performers = [n for n, h in weekly_totals.items() if h == max_hours and h > 0]
+
+    return {
+        "month": month_year or "Unknown",
+        "top_performers": top_performers,
+        "weekly_totals": weekly_totals,
+        "daily_hours": daily_hours,
+        "parser_version": PARSER_VERSION,
+    }
+
+
+def table_cells(graph):
+    """Cells from TABLES analysis, or rebuilt from geometry for plain text detection."""
+    if graph.of_type("CELL"):
+        return graph.cells()
+    return reconstruct_cells(graph)
+
+
+def summarize(response, cells=None):
+    """Timesheet summary for a complete Textract response, or for cells already taken from it."""
+    with stage("month"):
+        month_year = detect_month(response.get("Blocks", []))
+    if cells is None:
+        with stage("cells"):
+            cells = table_cells(BlockGraph.from_response(response))
+    with stage("hours"):
+        weekly_totals, daily_hours = hours_by_name(cells)
+        return build_summary(month_year, weekly_totals, daily_hours)
+
+
+class PagedSummary:
+    """Builds a summary from blocks that arrive one result page at a time.
+
+    Only WORD, LINE and CELL blocks of the current document page are kept;
+    each page is reduced to per-employee seconds as soon as the next one
+    starts, so memory stays bounded by the largest page rather than the whole
+    document. Hours for an employee listed on several pages are added up.
+    """
+
+    def __init__(self):
+        self.month_year = None
+        self._page = None
+        self._blocks = []
+        self._seconds = {}
+
+    def feed(self, blocks):
+        for block in blocks:
+            page = block.get("Page", 1)
+            if page != self._page:
+                self._flush()
+                self._page = page
+
+            if self.month_year is None:
+                self.month_year = detect_month([block])
+
+            if block.get("BlockType") in ("WORD", "LINE", "CELL"):
+                self._blocks.append(block)
+
+    def _flush(self):
+        if not self._blocks:
+            return
+        cells = table_cells(BlockGraph(self._blocks))
+
+        for name, daily_seconds in seconds_by_name(cells).items():
+            merged = self._seconds.setdefault(name, {})
+            for day, sec in daily_seconds.items():
+                merged[day] = merged.get(day, 0) + sec
+
+        self._blocks = []
+
+    def summary(self):
+        self._flush()
+        weekly_totals, daily_hours = hours_from_seconds(self._seconds)
+        return build_summary(self.month_year, weekly_totals, daily_hours)
@@ -0,0 +1,64 @@
+"""Per-request stage timings, reported in the Server-Timing header.
+
+A request installs a StageTimings in a context variable; code anywhere in the
+pipeline wraps its work in ``with stage("name"):`` and the duration is added
+to that request's breakdown. Outside a request ``stage`` is a no-op, so
+library code can use it unconditionally.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("stage_timings", default=None)
+
+
+class StageTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        # Stages that run more than once in a request (e.g. two Textract calls,
+        # or one per image on a batch's threads) add up.
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def as_dict(self):
+        """Milliseconds per stage plus the elapsed total so far."""
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.durations.items()}
+        timings["total"] = round(self.total() * 1000, 3)
+        return timings
+
+    def header(self):
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+
+def begin():
+    """Start timing the current context; returns a token for ``end``."""
+    return _current.set(StageTimings())
+
+
+def end(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
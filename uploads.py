@@ -0,0 +1,96 @@
+"""Uploaded images spooled to bounded temporary files.
+
+An upload is copied off the request in fixed-size chunks into a
+SpooledTemporaryFile, hashing and size-checking it in the same pass, so a
+worker holds at most ``UPLOAD_SPOOL_BYTES`` of any image in memory however
+large the scan is. Small images stay in memory; larger ones roll over to disk
+and are streamed from there to S3. Only a synchronous Textract call on a small
+image (see TEXTRACT_S3_THRESHOLD in analysis.py) reads an upload whole.
+
+The spool outlives the request, so background jobs can still use it; whoever
+finishes with an upload closes it.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from response_cache import digest_key
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif', '.pdf')
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def check_filename(filename):
+    if not (filename or '').lower().endswith(IMAGE_EXTENSIONS):
+        raise InvalidUpload("Invalid file format. Please upload an image or PDF file.")
+
+
+class Upload:
+    def __init__(self, filename, file, size, sha256):
+        self.filename = filename
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    @classmethod
+    def spool(cls, filename, stream, max_bytes=MAX_BYTES, spool_bytes=SPOOL_BYTES, chunk_size=CHUNK_SIZE):
+        """Copy ``stream`` into a bounded spool, hashing it on the way."""
+        file = tempfile.SpooledTemporaryFile(max_size=spool_bytes, dir=SPOOL_DIR)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload is larger than the {max_bytes // (1024 * 1024)} MB limit.")
+                digest.update(chunk)
+                file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        return cls(filename, file, size, digest.hexdigest())
+
+    @classmethod
+    def from_bytes(cls, filename, data):
+        return cls.spool(filename, io.BytesIO(data))
+
+    def content_key(self, *parts):
+        """Same key ``response_cache.content_key`` gives the upload's bytes."""
+        return digest_key(self.sha256, *parts)
+
+    def stream(self):
+        """The spool, rewound, for callers that read it incrementally."""
+        self.file.seek(0)
+        return self.file
+
+    def read(self):
+        """The whole upload; only for images small enough for the synchronous API."""
+        return self.stream().read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+